@@ -1,10 +1,36 @@
-from flask import Flask, request, jsonify
+import time
+
+# Measured from the first line of the module, for the readiness report
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import joblib
 import numpy as np
-import pandas as pd
 import os
+import hashlib
+import hmac
+import json
+import threading
+import zipfile
 from datetime import datetime
+from compiled_forest import CompiledForest
+from cascade import CascadeForest
+from lookup_index import LookupIndex, read_source_sha256
+from prediction_cache import PredictionCache
+from log_config import configure_logging
+from metrics import EarlyExitStats, Metrics, SamplingProfiler
+import bulk_classify
+import wire_format
+import logging
+import sys
+
+# The feature encoder lives next to the training script so both share it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model'))
+from feature_encoder import FeatureEncoder
+from feature_stats import load_statistics
+from drift import DriftMonitor
+
+logger = configure_logging()
 
 app = Flask(__name__)
 # Configure CORS for development and production
@@ -23,120 +49,375 @@ CORS(app,
 
 # Global variable to store the model
 model = None
-feature_columns = [
-    'length', 'height', 'width', 'weight', 
-    'engine_power', 'top_speed', 'axle_count', 
-    'seats', 'fuel_type_diesel', 'fuel_type_electric', 
-    'fuel_type_hybrid', 'fuel_type_petrol'
-]
+# Seconds spent in load_model() and from module import until the model was ready
+model_load_seconds = None
+startup_seconds = None
+# 'sklearn' serves the pickled RandomForestClassifier, 'compiled' serves the
+# flattened forest exported by model/create_model.py, 'compact' serves the
+# pruned, quantized forest from `create_model.py compress` for small
+# instances, 'cascade' serves the family cascade from `create_model.py
+# cascade` in front of the full model, and 'auto' (default) serves the
+# compiled forest when it exists since it loads without importing sklearn.
+# Missing artifacts fall back along compact/cascade -> compiled -> sklearn.
+MODEL_ENGINE = os.environ.get('MODEL_ENGINE', 'auto').lower()
+# Overrides the coarse-stage confidence the cascade was exported with
+CASCADE_MIN_CONFIDENCE = os.environ.get('CASCADE_MIN_CONFIDENCE')
+# Serve cells of the threshold grid from the lookup index written by
+# `create_model.py index` when it was built from the forest being served;
+# answers are identical, so it is on by default
+LOOKUP_INDEX = os.environ.get('LOOKUP_INDEX', '1').lower() in ('1', 'true', 'yes')
+# Memory-map the compiled forest read-only so gunicorn workers share one copy
+MODEL_MMAP = os.environ.get('MODEL_MMAP', '0').lower() in ('1', 'true', 'yes')
+# Seconds between checks of the model files for a new deploy (0 disables)
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 0))
+# Token required by the /admin endpoints; they are disabled when unset
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
 
-def load_model():
-    """Load the pretrained model"""
-    global model
+# Request counters and latency histograms served on /metrics, and an opt-in
+# profiler that cProfiles PROFILE_SAMPLE_RATE of all requests (0 disables)
+metrics = Metrics()
+profiler = SamplingProfiler(float(os.environ.get('PROFILE_SAMPLE_RATE', 0)))
+
+# Version details of the serving model and the outcome of the last reload
+active_model_details = {}
+last_reload = None
+_reload_lock = threading.Lock()
+
+# Cache of recent single-vehicle predictions, keyed on the quantized feature
+# vector. PREDICTION_CACHE_SIZE=0 disables it, PREDICTION_CACHE_TTL=0 means
+# entries never expire.
+prediction_cache = PredictionCache(
+    maxsize=int(os.environ.get('PREDICTION_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('PREDICTION_CACHE_TTL', 0)),
+    decimals=int(os.environ.get('PREDICTION_CACHE_DECIMALS', 3))
+)
+# Shared with create_model.py, so serving uses the column order the model was trained on
+feature_encoder = FeatureEncoder()
+feature_columns = feature_encoder.feature_columns
+required_fields = feature_encoder.required_fields
+fuel_types = feature_encoder.fuel_types
+
+# A new model must produce valid probabilities for these before it is swapped
+# in: a sports bike, sedan, SUV, coach and heavy truck
+CANARY_FEATURES = np.array([
+    [2.0, 1.1, 0.8, 200, 150, 180, 2, 1, 0, 0, 0, 1],
+    [4.5, 1.5, 1.9, 1500, 150, 180, 2, 5, 0, 0, 0, 1],
+    [5.2, 1.9, 2.1, 2200, 250, 200, 2, 7, 1, 0, 0, 0],
+    [12.0, 3.2, 2.5, 15000, 350, 100, 3, 50, 1, 0, 0, 0],
+    [8.5, 3.0, 2.4, 12000, 400, 120, 4, 2, 1, 0, 0, 0],
+], dtype=float)
+
+# Upper bound on the number of vehicles accepted by /predict/batch
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 10000))
+
+# Rows classified per model call by /predict/stream
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 5000))
+
+# Histograms of /predict inputs and predictions, compared on /drift with the
+# training distribution saved by create_model.py (DRIFT_MONITORING=0 disables).
+# Rows arriving while DRIFT_QUEUE_DEPTH requests wait to be counted are dropped.
+DRIFT_MONITORING = os.environ.get('DRIFT_MONITORING', '1').lower() in ('1', 'true', 'yes')
+DRIFT_QUEUE_DEPTH = int(os.environ.get('DRIFT_QUEUE_DEPTH', 10000))
+drift_monitor = None
+# Modification time and size of the statistics file drift_monitor was built from
+_drift_statistics_signature = None
+
+# Early-exit inference for /predict on the compiled and compact forests: trees
+# are evaluated EARLY_EXIT_CHUNK at a time, stopping once the leading class
+# can no longer be overtaken or, if EARLY_EXIT_CONFIDENCE is set, once its
+# confidence reaches that bound. EARLY_EXIT=1 turns it on by default;
+# ?early_exit=1 or 0 chooses per request.
+EARLY_EXIT = os.environ.get('EARLY_EXIT', '0').lower() in ('1', 'true', 'yes')
+EARLY_EXIT_CHUNK = int(os.environ.get('EARLY_EXIT_CHUNK', 10))
+EARLY_EXIT_CONFIDENCE = float(os.environ['EARLY_EXIT_CONFIDENCE']) if os.environ.get('EARLY_EXIT_CONFIDENCE') else None
+early_exit_stats = EarlyExitStats()
+
+def _model_paths():
+    """Paths of the pickled model and the compiled, compact, cascade and index artifacts next to it"""
+    # Get the directory of the current script
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    model_path = os.path.join(current_dir, '..', 'model', 'vehicle_model.pkl')
+    model_path = os.path.normpath(model_path)  # Normalize the path
+    compiled_path = os.path.join(os.path.dirname(model_path), 'vehicle_model_forest.npz')
+    compact_path = os.path.join(os.path.dirname(model_path), 'vehicle_model_compact.npz')
+    cascade_path = os.path.join(os.path.dirname(model_path), 'vehicle_model_cascade.npz')
+    index_path = os.path.join(os.path.dirname(model_path), 'vehicle_model_index.npz')
+    return model_path, compiled_path, compact_path, cascade_path, index_path
+
+def _training_stats_path():
+    return os.path.join(os.path.dirname(_model_paths()[0]), 'vehicle_model_stats.json')
+
+def _load_drift_monitor(current=None):
+    """A drift monitor for the training statistics on disk, or None without them.
+
+    ``current`` is kept, with the counts it has gathered, while the
+    statistics file is the one it was built from.
+    """
+    global _drift_statistics_signature
+    if not DRIFT_MONITORING:
+        return None
+    path = _training_stats_path()
     try:
-        # Get the directory of the current script
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(current_dir, '..', 'model', 'vehicle_model.pkl')
-        model_path = os.path.normpath(model_path)  # Normalize the path
-        
-        if os.path.exists(model_path):
-            model = joblib.load(model_path)
-            print(f"NEW DETAILED Model loaded successfully from {model_path}")
-            if hasattr(model, 'classes_'):
-                print(f"Model classes: {list(model.classes_)}")
-        else:
-            print(f"Model file not found at {model_path}")
-            # Create a dummy model for demonstration
-            create_dummy_model()
-    except Exception as e:
-        print(f"Error loading model: {e}")
-        create_dummy_model()
+        stat = os.stat(path)
+    except OSError:
+        logger.warning("No training statistics at %s; drift monitoring is off until the model is retrained", path)
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+    if current is not None and signature == _drift_statistics_signature:
+        return current
+    try:
+        statistics = load_statistics(path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Could not read training statistics %s: %s", path, e)
+        return None
+    if statistics['feature_columns'] != feature_columns:
+        logger.warning("Training statistics in %s are for other feature columns; drift monitoring is off", path)
+        return None
+    _drift_statistics_signature = signature
+    return DriftMonitor(statistics, DRIFT_QUEUE_DEPTH)
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# A missing, truncated or half-written artifact raises one of these; the
+# loaders then fall back to the next engine rather than failing the load
+_ARTIFACT_ERRORS = (ValueError, OSError, zipfile.BadZipFile, KeyError)
+
+def _load_compiled(compiled_path):
+    """Load the compiled forest, or return None so the caller falls back to sklearn"""
+    if not os.path.exists(compiled_path):
+        if MODEL_ENGINE in ('compiled', 'compact'):
+            logger.warning("Compiled forest not found, falling back", extra={'fields': {'path': compiled_path}})
+        return None
+    try:
+        return CompiledForest.load(compiled_path, mmap_mode='r' if MODEL_MMAP else None)
+    except _ARTIFACT_ERRORS as e:
+        logger.warning("Compiled forest unusable, falling back: %s", e)
+        return None
+
+def _load_cascade(cascade_path, fallback):
+    """Load the cascade in front of the full model, or None to serve the full model alone"""
+    if not os.path.exists(cascade_path):
+        logger.warning("Cascade not found, serving the full model", extra={'fields': {'path': cascade_path}})
+        return None
+    min_confidence = float(CASCADE_MIN_CONFIDENCE) if CASCADE_MIN_CONFIDENCE else None
+    try:
+        return CascadeForest.load(cascade_path, fallback, mmap_mode='r' if MODEL_MMAP else None,
+                                  min_confidence=min_confidence)
+    except _ARTIFACT_ERRORS as e:
+        logger.warning("Cascade unusable, serving the full model: %s", e)
+        return None
+
+def _load_lookup_index(index_path, forest, forest_sha256):
+    """The lookup index in front of forest, or None when there is none for it"""
+    if not LOOKUP_INDEX or not os.path.exists(index_path):
+        return None
+    try:
+        # A stale index is recognised from its recorded source before its arrays are read
+        if read_source_sha256(index_path) != forest_sha256:
+            logger.info("Lookup index was built from another artifact, serving the forest alone",
+                        extra={'fields': {'path': index_path}})
+            return None
+        return LookupIndex.load(index_path, forest, mmap_mode='r' if MODEL_MMAP else None)
+    except _ARTIFACT_ERRORS as e:
+        logger.warning("Lookup index unusable, serving the forest alone: %s", e)
+        return None
+
+def _read_model():
+    """Load the model artifact selected by MODEL_ENGINE without activating it.
 
-def create_dummy_model():
-    """Create a dummy model for demonstration purposes"""
-    global model
-    from sklearn.ensemble import RandomForestClassifier
+    Returns (model, details) or (None, None) when no artifact exists.
+    """
+    model_path, compiled_path, compact_path, cascade_path, index_path = _model_paths()
     
-    # Create dummy training data
-    np.random.seed(42)
-    n_samples = 1000
+    compact = _load_compiled(compact_path) if MODEL_ENGINE == 'compact' else None
+    compiled = None
+    if compact is None and MODEL_ENGINE in ('auto', 'compiled', 'compact', 'cascade'):
+        compiled = _load_compiled(compiled_path)
+    if compact is not None:
+        new_model, path, engine = compact, compact_path, 'compact'
+    elif compiled is not None:
+        new_model, path, engine = compiled, compiled_path, 'compiled'
+    elif os.path.exists(model_path):
+        # Only the pickle path needs joblib (and, through it, sklearn)
+        import joblib
+        new_model, path, engine = joblib.load(model_path), model_path, 'sklearn'
+    else:
+        logger.warning("Model file not found", extra={'fields': {'path': model_path}})
+        return None, None
     
-    # Generate synthetic features
-    X = np.random.rand(n_samples, 12)
+    if MODEL_ENGINE == 'cascade':
+        cascade = _load_cascade(cascade_path, new_model)
+        if cascade is not None:
+            new_model, path, engine = cascade, cascade_path, 'cascade'
     
-    # Create realistic vehicle data ranges
-    X[:, 0] = np.random.uniform(2, 15, n_samples)  # length (2-15m)
-    X[:, 1] = np.random.uniform(1.2, 4, n_samples)  # height (1.2-4m)
-    X[:, 2] = np.random.uniform(1.5, 3, n_samples)  # width (1.5-3m)
-    X[:, 3] = np.random.uniform(500, 40000, n_samples)  # weight (500-40000kg)
-    X[:, 4] = np.random.uniform(50, 500, n_samples)  # engine_power (50-500hp)
-    X[:, 5] = np.random.uniform(60, 300, n_samples)  # top_speed (60-300km/h)
-    X[:, 6] = np.random.randint(2, 8, n_samples)  # axle_count (2-7)
-    X[:, 7] = np.random.randint(1, 60, n_samples)  # seats (1-60)
+    sha256 = _file_sha256(path)
+    lookup_index_path = None
+    if engine in ('compiled', 'compact'):
+        index = _load_lookup_index(index_path, new_model, sha256)
+        if index is not None:
+            new_model, lookup_index_path = index, index_path
+    details = {
+        'engine': engine,
+        'path': path,
+        'sha256': sha256,
+        'version': sha256[:12],
+        'modified_at': datetime.fromtimestamp(os.path.getmtime(path)).isoformat(),
+        'lookup_index': lookup_index_path,
+    }
+    return new_model, details
+
+def _swap_model(new_model, details):
+    """Make new_model the one /predict uses"""
+    global model, active_model_details, drift_monitor, startup_seconds
+    # Rebinding the global is atomic; requests already running keep the
+    # reference they took at their start
+    model = new_model
+    active_model_details = dict(details, loaded_at=datetime.now().isoformat())
+    # Cached predictions belong to the previous model
+    prediction_cache.clear()
+    # and production inputs are compared with the new model's training data;
+    # the old monitor's aggregator thread is stopped when it is replaced
+    previous_monitor = drift_monitor
+    drift_monitor = _load_drift_monitor(previous_monitor)
+    if previous_monitor is not None and previous_monitor is not drift_monitor:
+        previous_monitor.stop()
+    if startup_seconds is None:
+        startup_seconds = time.perf_counter() - _import_started
+    logger.info("Model activated", extra={'fields': {
+        **active_model_details, 'classes': [str(c) for c in getattr(new_model, 'classes_', [])]}})
+
+def validate_model(candidate):
+    """Check a freshly loaded model against the canary vectors before it serves traffic"""
+    classes = getattr(candidate, 'classes_', None)
+    if classes is None or len(classes) == 0:
+        raise ValueError('Model has no classes')
+    if getattr(candidate, 'n_features_in_', len(feature_columns)) != len(feature_columns):
+        raise ValueError(f'Model expects {candidate.n_features_in_} features, the API provides {len(feature_columns)}')
+    trained_columns = getattr(candidate, 'feature_columns', None)
+    if trained_columns is not None and list(trained_columns) != feature_columns:
+        raise ValueError(f'Model was trained on columns {list(trained_columns)}, the API provides {feature_columns}')
     
-    # One-hot encoded fuel type (last 4 columns)
-    fuel_types = np.zeros((n_samples, 4))
-    fuel_choice = np.random.randint(0, 4, n_samples)
-    fuel_types[np.arange(n_samples), fuel_choice] = 1
-    X[:, 8:12] = fuel_types
+    probabilities = np.asarray(candidate.predict_proba(CANARY_FEATURES))
+    if probabilities.shape != (len(CANARY_FEATURES), len(classes)):
+        raise ValueError(f'Canary predictions have shape {probabilities.shape}')
+    if not np.isfinite(probabilities).all() or not np.allclose(probabilities.sum(axis=1), 1.0):
+        raise ValueError('Canary predictions are not valid probability distributions')
     
-    # Generate labels based on realistic rules
-    y = []
-    for i in range(n_samples):
-        length, height, weight, seats = X[i, 0], X[i, 1], X[i, 3], X[i, 7]
-        
-        if length < 3 and seats <= 2:
-            y.append('Bike')
-        elif length < 5.5 and weight < 2500 and seats <= 7:
-            y.append('Car')
-        elif 5 <= length <= 6 and weight < 3000 and seats <= 7:
-            y.append('SUV')
-        elif length > 8 and seats > 20:
-            y.append('Bus')
-        elif weight > 7500:
-            y.append('Truck')
+    # Agreement with the serving model is reported, not enforced: a retrained
+    # model is expected to change some answers
+    current = model
+    agreement = None
+    if current is not None:
+        current_labels = current.classes_[current.predict_proba(CANARY_FEATURES).argmax(axis=1)]
+        agreement = float(np.mean(current_labels == classes[probabilities.argmax(axis=1)]))
+    return {'canaries': len(CANARY_FEATURES), 'agreement_with_previous': agreement}
+
+def reload_model():
+    """Load the artifact on disk, validate it and swap it in without a restart"""
+    global last_reload
+    with _reload_lock:
+        started = time.perf_counter()
+        result = {'started_at': datetime.now().isoformat()}
+        try:
+            new_model, details = _read_model()
+            if new_model is None:
+                raise FileNotFoundError('No model artifact found')
+            result.update(validate_model(new_model))
+            _swap_model(new_model, details)
+            result.update(status='swapped', version=details['version'], engine=details['engine'])
+        except Exception as e:
+            logger.exception("Model reload failed, keeping the current model")
+            result.update(status='failed', error=str(e))
+        result['seconds'] = time.perf_counter() - started
+        last_reload = result
+        return result
+
+def _artifact_signature():
+    """Modification time and size of every model artifact, to detect new deploys"""
+    signature = []
+    for path in _model_paths():
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+def _watch_model_files():
+    """Poll the model artifacts and reload when they change"""
+    seen = _artifact_signature()
+    pending = None
+    while True:
+        time.sleep(MODEL_WATCH_INTERVAL)
+        current = _artifact_signature()
+        if current == seen:
+            pending = None
+        elif current == pending:
+            # Unchanged for a whole interval, so the writer has finished
+            logger.info("Model artifact changed on disk, reloading")
+            reload_model()
+            seen, pending = current, None
         else:
-            y.append('Car')  # default
-    
-    # Train the model
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
-    model.fit(X, y)
+            pending = current
+
+def start_model_watcher():
+    """Start the artifact watcher thread when MODEL_WATCH_INTERVAL is set"""
+    if MODEL_WATCH_INTERVAL > 0:
+        threading.Thread(target=_watch_model_files, name='model-watcher', daemon=True).start()
+
+def load_model():
+    """Load the pretrained model.
+
+    Without a usable artifact no model is installed and /health/ready keeps
+    answering 503 until one is deployed and loaded by the watcher or
+    /admin/reload-model.
+    """
+    global model_load_seconds
+    load_started = time.perf_counter()
+    try:
+        new_model, details = _read_model()
+    except Exception as e:
+        logger.exception("Error loading model: %s", e)
+        new_model = None
     
-    # Save the model
-    os.makedirs('../model', exist_ok=True)
-    joblib.dump(model, '../model/vehicle_model.pkl')
-    print("Dummy model created and saved successfully")
+    if new_model is not None:
+        _swap_model(new_model, details)
+    else:
+        logger.error("No usable model artifact; run model/create_model.py")
+    model_load_seconds = time.perf_counter() - load_started
 
 def preprocess_input(data):
     """Preprocess input data for prediction"""
-    # Create feature vector
-    features = [
-        float(data['length']),
-        float(data['height']),
-        float(data['width']),
-        float(data['weight']),
-        float(data['engine_power']),
-        float(data['top_speed']),
-        int(data['axle_count']),
-        int(data['seats']),
-    ]
-    
-    # One-hot encode fuel type
-    fuel_type = data['fuel_type'].lower()
-    fuel_encoding = [0, 0, 0, 0]  # diesel, electric, hybrid, petrol
-    
-    if fuel_type == 'diesel':
-        fuel_encoding[0] = 1
-    elif fuel_type == 'electric':
-        fuel_encoding[1] = 1
-    elif fuel_type == 'hybrid':
-        fuel_encoding[2] = 1
-    elif fuel_type == 'petrol':
-        fuel_encoding[3] = 1
-    
-    features.extend(fuel_encoding)
-    
-    return np.array(features).reshape(1, -1)
+    return feature_encoder.encode_one(data)
+
+def preprocess_batch(records):
+    """Preprocess a batch of vehicles into a single feature matrix.
+
+    ``records`` is either a list of vehicle objects or a dict of equal-length
+    columns keyed by field name. Returns the feature matrix for the valid rows,
+    the original indices of those rows and a dict of per-row error messages.
+    The matrix may be a view of a per-thread buffer, so use it before
+    preprocessing the next batch on the same thread.
+    """
+    return feature_encoder.encode_records(records)
+
+def class_labels(current_model):
+    """Class names of a model as plain strings, in predict_proba column order"""
+    labels = getattr(current_model, 'class_labels', None)
+    if labels is None:
+        labels = current_model.class_labels = [str(label) for label in current_model.classes_]
+    return labels
+
+@app.before_request
+def start_request_metrics():
+    """Note the start time and, for sampled requests, start the profiler"""
+    g.request_started = time.perf_counter()
+    g.profiler = profiler.start()
 
 # Add OPTIONS handler for preflight requests
 @app.before_request
@@ -169,17 +450,28 @@ def after_request(response):
     
     if origin in allowed_origins:
         response.headers.add('Access-Control-Allow-Origin', origin)
-        print(f"Added CORS header for origin: {origin}")
+        logger.debug("Added CORS header for origin: %s", origin)
     else:
         # For debugging - allow all origins temporarily
         response.headers.add('Access-Control-Allow-Origin', origin or '*')
-        print(f"Added CORS header for unknown origin: {origin}")
+        logger.debug("Added CORS header for unknown origin: %s", origin)
     
     response.headers.add('Access-Control-Allow-Headers', "Content-Type,Authorization,X-Requested-With")
     response.headers.add('Access-Control-Allow-Methods', "GET,PUT,POST,DELETE,OPTIONS")
     response.headers.add('Access-Control-Allow-Credentials', 'false')
     return response
 
+@app.after_request
+def record_request_metrics(response):
+    """Count the response and record how long the request took"""
+    started = g.get('request_started')
+    metrics.observe_request(request.endpoint or 'unknown', request.method, response.status_code,
+                            time.perf_counter() - started if started is not None else None)
+    if g.get('profiler') is not None:
+        profiler.stop(g.profiler)
+        g.profiler = None
+    return response
+
 @app.route('/', methods=['GET'])
 def home():
     """Health check endpoint"""
@@ -194,16 +486,15 @@ def home():
 @app.route('/cors-test', methods=['GET', 'POST', 'OPTIONS'])
 def cors_test():
     """Test CORS configuration"""
-    print(f"CORS test called with method: {request.method}")
-    print(f"Origin: {request.headers.get('Origin', 'No origin')}")
+    logger.debug("CORS test called", extra={'fields': {
+        'method': request.method, 'origin': request.headers.get('Origin')}})
     
     if request.method == 'OPTIONS':
-        print("Handling OPTIONS in cors-test")
         return jsonify({'status': 'OK'})
     
     if request.method == 'POST':
         data = request.get_json()
-        print(f"POST data received: {data}")
+        logger.debug("CORS test POST data", extra={'fields': {'data': data}})
         return jsonify({
             'message': 'CORS POST is working correctly!',
             'received_data': data,
@@ -224,59 +515,164 @@ def health_check():
     """Detailed health check for monitoring"""
     return jsonify({
         'status': 'healthy' if model is not None else 'unhealthy',
+        'live': True,
+        'ready': model is not None,
         'model_loaded': model is not None,
+        'model_load_seconds': model_load_seconds,
+        'startup_seconds': startup_seconds,
         'api_version': '1.0.0',
         'python_version': '3.11.0',
+        'cache': prediction_cache.stats(),
+        'cascade': model.stats() if isinstance(model, CascadeForest) else None,
+        'lookup_index': model.stats() if isinstance(model, LookupIndex) else None,
+        'early_exit': dict(early_exit_stats.stats(), enabled=EARLY_EXIT, chunk_size=EARLY_EXIT_CHUNK,
+                           min_confidence=EARLY_EXIT_CONFIDENCE),
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return jsonify({'live': True})
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: a model is loaded and /predict can answer"""
+    if model is None:
+        return jsonify({'ready': False}), 503
+    return jsonify({'ready': True, 'startup_seconds': startup_seconds})
+
 @app.route('/predict', methods=['POST', 'OPTIONS'])
 def predict():
     """Predict vehicle type based on input features"""
-    print(f"Predict endpoint called from origin: {request.headers.get('Origin', 'No origin')}")
-    print(f"Request method: {request.method}")
-    print(f"Content-Type: {request.headers.get('Content-Type', 'No content type')}")
-    
     # Handle OPTIONS request (preflight)
     if request.method == 'OPTIONS':
-        print("Handling OPTIONS request in predict endpoint")
         return jsonify({'status': 'OK'})
     
+    # Hold one reference for the whole request so a concurrent reload can't
+    # mix two models in one answer
+    current_model = model
+    stage_started = time.perf_counter()
     try:
-        if model is None:
-            print("Error: Model not loaded")
+        if current_model is None:
+            logger.error("Predict called before the model was loaded")
             return jsonify({'error': 'Model not loaded'}), 500
         
         data = request.get_json()
-        print(f"Received data: {data}")
+        stage_started = metrics.observe_stage('parse', stage_started)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Predict request", extra={'fields': {
+                'origin': request.headers.get('Origin'),
+                'content_type': request.headers.get('Content-Type'),
+                'data': data}})
         
         # Validate required fields
-        required_fields = [
-            'length', 'height', 'width', 'weight', 
-            'engine_power', 'top_speed', 'axle_count', 
-            'seats', 'fuel_type'
-        ]
-        
         for field in required_fields:
             if field not in data:
                 return jsonify({'error': f'Missing field: {field}'}), 400
+        stage_started = metrics.observe_stage('validate', stage_started)
         
         # Preprocess input
         features = preprocess_input(data)
+        stage_started = metrics.observe_stage('preprocess', stage_started)
         
-        # Make prediction
-        prediction = model.predict(features)[0]
+        early_exit_requested = request.args.get('early_exit', '1' if EARLY_EXIT else '0').lower() in ('1', 'true', 'yes')
+        # Engines that cannot stop early (sklearn, cascade) answer the usual way
+        early_exit = early_exit_requested and hasattr(current_model, 'predict_proba_early_exit')
+        cache_key = prediction_cache.make_key(features)
+        if early_exit and cache_key is not None:
+            # Early-exit confidences come from fewer trees, so keep them apart
+            cache_key += b'early_exit'
+        cached = prediction_cache.get(cache_key)
+        stage_started = metrics.observe_stage('cache', stage_started)
+        trees_evaluated = 0
+        if cached is not None:
+            class_index, confidence = cached
+        else:
+            # One forest pass gives both the class (argmax) and its confidence
+            if early_exit:
+                probabilities, trees = current_model.predict_proba_early_exit(
+                    features, EARLY_EXIT_CHUNK, EARLY_EXIT_CONFIDENCE)
+                probabilities, trees_evaluated = probabilities[0], int(trees[0])
+                early_exit_stats.record(trees_evaluated, current_model.n_estimators)
+            else:
+                probabilities = current_model.predict_proba(features)[0]
+            class_index = int(probabilities.argmax())
+            confidence = float(probabilities[class_index])
+            
+            prediction_cache.put(cache_key, (class_index, confidence))
+            stage_started = metrics.observe_stage('model', stage_started)
+        
+        result = {
+            'prediction': class_labels(current_model)[class_index],
+            'confidence': confidence,
+            'timestamp': datetime.now().isoformat()
+        }
+        if early_exit_requested:
+            # null when the serving engine has no early exit
+            result['trees_evaluated'] = trees_evaluated if early_exit else None
+        monitor = drift_monitor
+        if monitor is not None:
+            monitor.observe(features, (class_index,), class_labels(current_model))
+        if request.args.get('echo', 'true').lower() not in ('0', 'false', 'no'):
+            result['input_data'] = data
+        response = jsonify(result)
+        metrics.observe_stage('serialize', stage_started)
+        return response
+    
+    except ValueError as e:
+        return jsonify({'error': f'Invalid input data: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+
+def _count_rows(data):
+    """Number of vehicles in a list of vehicles or an object of columns"""
+    if isinstance(data, dict):
+        return max((len(v) for v in data.values() if isinstance(v, list)), default=0)
+    return len(data) if isinstance(data, list) else 0
+
+@app.route('/predict/batch', methods=['POST', 'OPTIONS'])
+def predict_batch():
+    """Predict vehicle types for a batch of vehicles in one model call"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'OK'})
+    
+    current_model = model
+    try:
+        if current_model is None:
+            return jsonify({'error': 'Model not loaded'}), 500
+        
+        data = request.get_json()
+        if isinstance(data, dict) and 'vehicles' in data:
+            data = data['vehicles']
+        
+        n_rows = _count_rows(data)
+        if n_rows > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Batch too large: {n_rows} vehicles (max {MAX_BATCH_SIZE})'}), 413
         
-        # Get prediction probabilities if available
-        confidence = None
-        if hasattr(model, 'predict_proba'):
-            probabilities = model.predict_proba(features)[0]
-            confidence = float(max(probabilities))
+        features, row_index, errors = preprocess_batch(data)
+        
+        # One forest pass for the whole batch; labels come from the argmax
+        predictions = {}
+        if len(row_index):
+            probabilities = current_model.predict_proba(features)
+            best = probabilities.argmax(axis=1)
+            confidences = probabilities[np.arange(len(best)), best].tolist()
+            predictions = dict(zip(row_index.tolist(), zip(best.tolist(), confidences)))
+        
+        labels = class_labels(current_model)
+        results = []
+        for i in range(len(predictions) + len(errors)):
+            if i in errors:
+                results.append({'index': i, 'error': errors[i]})
+            else:
+                class_index, confidence = predictions[i]
+                results.append({'index': i, 'prediction': labels[class_index], 'confidence': confidence})
         
         return jsonify({
-            'prediction': prediction,
-            'confidence': confidence,
-            'input_data': data,
+            'predictions': results,
+            'count': len(results),
+            'error_count': len(errors),
             'timestamp': datetime.now().isoformat()
         })
     
@@ -285,28 +681,236 @@ def predict():
     except Exception as e:
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
 
+@app.route('/predict/compact', methods=['POST', 'OPTIONS'])
+def predict_compact():
+    """Class indices and confidences for JSON, MessagePack or packed float32 input"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'OK'})
+    
+    current_model = model
+    version = active_model_details.get('version')
+    try:
+        if current_model is None:
+            return jsonify({'error': 'Model not loaded'}), 500
+        
+        input_format = wire_format.request_format(request.mimetype)
+        output_format = wire_format.response_format(request.accept_mimetypes)
+        body = request.get_data(cache=False)
+        
+        errors = {}
+        if input_format == wire_format.FEATURES:
+            # Rows arrive already encoded in feature_columns order
+            features = wire_format.decode_features(body, len(feature_columns))
+            n_rows = len(features)
+            row_index = np.arange(n_rows)
+        else:
+            if input_format == wire_format.MSGPACK:
+                data = wire_format.decode_msgpack(body)
+            else:
+                data = json.loads(body)
+            if isinstance(data, dict) and 'vehicles' in data:
+                data = data['vehicles']
+            if isinstance(data, dict) and not isinstance(data.get(required_fields[0]), list):
+                data = [data]  # a single vehicle
+            n_rows = _count_rows(data)
+        if n_rows > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Batch too large: {n_rows} vehicles (max {MAX_BATCH_SIZE})'}), 413
+        if input_format != wire_format.FEATURES:
+            features, row_index, errors = preprocess_batch(data)
+        
+        class_index = np.full(n_rows, -1)
+        confidence = np.zeros(n_rows)
+        if len(row_index):
+            probabilities = current_model.predict_proba(features)
+            best = probabilities.argmax(axis=1)
+            class_index[row_index] = best
+            confidence[row_index] = probabilities[np.arange(len(best)), best]
+        
+        if output_format == wire_format.PREDICTIONS:
+            response = Response(wire_format.encode_predictions(class_index, confidence),
+                                mimetype=wire_format.PREDICTIONS)
+        else:
+            result = {
+                'model_version': version,
+                'class_index': class_index.tolist(),
+                'confidence': confidence.tolist(),
+            }
+            if errors:
+                result['errors'] = [[i, message] for i, message in sorted(errors.items())]
+            if output_format == wire_format.MSGPACK:
+                response = Response(wire_format.encode_msgpack(result), mimetype=wire_format.MSGPACK)
+            else:
+                response = jsonify(result)
+        # Lets binary clients check that their cached class table still applies
+        response.headers['X-Model-Version'] = version or ''
+        return response
+    
+    except wire_format.UnsupportedMediaType as e:
+        return jsonify({'error': str(e)}), 415
+    except ValueError as e:
+        return jsonify({'error': f'Invalid input data: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+
+@app.route('/predict/stream', methods=['POST', 'OPTIONS'])
+def predict_stream():
+    """Classify a CSV or NDJSON upload chunk by chunk, streaming NDJSON results"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'OK'})
+    
+    # The whole file is classified by the model that was active when it started
+    current_model = model
+    if current_model is None:
+        return jsonify({'error': 'Model not loaded'}), 500
+    
+    try:
+        input_format = bulk_classify.detect_format(request.mimetype, request.args.get('format'))
+        chunk_size = request.args.get('chunk_size', BULK_CHUNK_SIZE, type=int)
+        if not 0 < chunk_size <= MAX_BATCH_SIZE:
+            raise ValueError(f'chunk_size must be between 1 and {MAX_BATCH_SIZE}')
+        
+        lines = bulk_classify.iter_text_lines(request.stream)
+        if input_format == 'csv':
+            # Reads the header now so a bad one is a 400 rather than a broken stream
+            records = bulk_classify.iter_csv_records(lines, required_fields)
+        else:
+            records = bulk_classify.iter_ndjson_records(lines)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid input data: {str(e)}'}), 400
+    
+    def generate():
+        try:
+            chunks = bulk_classify.iter_chunks(records, chunk_size)
+            yield from bulk_classify.classify_chunks(current_model, class_labels(current_model), chunks,
+                                                     preprocess_batch, request.args.get('id_field'))
+        except Exception as e:
+            # Headers are already sent, so the failure is reported in-band
+            logger.error("Streaming prediction failed", extra={'fields': {'error': str(e)}})
+            yield json.dumps({'error': f'Prediction failed: {str(e)}'}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/model-info', methods=['GET'])
 def model_info():
     """Get information about the loaded model"""
-    if model is None:
+    current_model = model
+    if current_model is None:
         return jsonify({'error': 'Model not loaded'}), 500
     
     info = {
-        'model_type': str(type(model).__name__),
+        'model_type': str(type(current_model).__name__),
+        'engine': active_model_details.get('engine'),
+        'version': active_model_details.get('version'),
+        'sha256': active_model_details.get('sha256'),
+        'artifact': active_model_details.get('path'),
+        'lookup_index': active_model_details.get('lookup_index'),
+        'modified_at': active_model_details.get('modified_at'),
+        'loaded_at': active_model_details.get('loaded_at'),
+        'last_reload': last_reload,
         'feature_count': len(feature_columns),
         'features': feature_columns
     }
     
-    if hasattr(model, 'classes_'):
-        info['classes'] = list(model.classes_)
+    if hasattr(current_model, 'classes_'):
+        info['classes'] = list(current_model.classes_)
     
     return jsonify(info)
 
+def _admin_error():
+    """Error response unless the request carries ADMIN_TOKEN, else None"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled (set ADMIN_TOKEN)'}), 403
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied, ADMIN_TOKEN):
+        return jsonify({'error': 'Invalid admin token'}), 401
+    return None
+
+@app.route('/admin/reload-model', methods=['POST'])
+def admin_reload_model():
+    """Reload the model from disk in the background and swap it in once validated"""
+    error = _admin_error()
+    if error:
+        return error
+    
+    if request.args.get('wait', '').lower() in ('1', 'true', 'yes'):
+        result = reload_model()
+        return jsonify(result), 200 if result['status'] == 'swapped' else 422
+    
+    threading.Thread(target=reload_model, name='model-reload', daemon=True).start()
+    return jsonify({'status': 'reloading', 'current_version': active_model_details.get('version')}), 202
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, latency, model and cache metrics in Prometheus text format"""
+    cache = prediction_cache.stats()
+    monitor = drift_monitor
+    drift = monitor.report() if monitor is not None else None
+    gauges = [
+        ('model_loaded', 'Whether a model is loaded.', model is not None, ()),
+        ('model_load_seconds', 'Duration of the last model load.', model_load_seconds, ()),
+        ('startup_seconds', 'Time from import to the first model being ready.', startup_seconds, ()),
+        ('model_info', 'Version of the serving model.', 1, (
+            ('version', active_model_details.get('version')),
+            ('engine', active_model_details.get('engine')))),
+        ('prediction_cache_entries', 'Entries in the prediction cache.', cache['size'], ()),
+        ('prediction_cache_hits', 'Prediction cache hits.', cache['hits'], ()),
+        ('prediction_cache_misses', 'Prediction cache misses.', cache['misses'], ()),
+        ('prediction_cache_evictions', 'Prediction cache LRU evictions.', cache['evictions'], ()),
+        ('prediction_cache_expirations', 'Prediction cache TTL expirations.', cache['expirations'], ()),
+        ('profiled_requests', 'Requests sampled by the profiler.', profiler.sampled_requests, ()),
+        ('early_exit_trees_evaluated', 'Trees evaluated by early-exit predictions.',
+         early_exit_stats.trees_evaluated, ()),
+        ('early_exit_trees_available', 'Trees available to early-exit predictions.',
+         early_exit_stats.trees_available, ()),
+    ]
+    if drift is not None:
+        gauges.append(('drift_rows', 'Rows counted by the drift monitor.', drift['rows'], ()))
+        gauges.append(('drift_dropped_rows', 'Rows the drift monitor had no room to queue.', drift['dropped'], ()))
+        for name, result in list(drift['features'].items()) + [('fuel_type', drift['fuel_type']),
+                                                               ('prediction', drift['prediction'])]:
+            gauges.append(('drift_psi', 'Population stability index against the training data.',
+                           result['psi'], (('feature', name),)))
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile', methods=['GET', 'DELETE'])
+def debug_profile():
+    """Aggregated cProfile output of the sampled requests"""
+    error = _admin_error()
+    if error:
+        return error
+    if request.method == 'DELETE':
+        profiler.reset()
+        return jsonify({'status': 'reset'})
+    limit = request.args.get('limit', 30, type=int)
+    return Response(profiler.report(limit, request.args.get('sort', 'cumulative')), mimetype='text/plain')
+
+@app.route('/drift', methods=['GET', 'DELETE'])
+def drift_report():
+    """Production input and prediction distributions against the training data"""
+    monitor = drift_monitor
+    if request.method == 'DELETE':
+        error = _admin_error()
+        if error:
+            return error
+        if monitor is not None:
+            monitor.reset()
+        return jsonify({'status': 'reset'})
+    if monitor is None:
+        return jsonify({'error': 'Drift monitoring is off (DRIFT_MONITORING=0, or no training statistics '
+                                 'next to the model; retrain with create_model.py)'}), 404
+    return jsonify(monitor.report())
+
 if __name__ == '__main__':
-    print("Starting Flask app with detailed model...")
+    logger.info("Starting Flask development server")
     load_model()
+    start_model_watcher()
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=False, host='0.0.0.0', port=port)
 
 # Load model on startup (for production)
-load_model()
\ No newline at end of file
+load_model()
+start_model_watcher()
+# Under gunicorn the app is imported in the master, and threads don't survive
+# fork, so each worker starts its own watcher
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=start_model_watcher)
\ No newline at end of file
@@ -0,0 +1,290 @@
+"""
+ASGI serving mode with micro-batching of concurrent /predict requests
+
+Concurrent single-vehicle requests are queued and evaluated together: the
+scheduler waits up to MICROBATCH_MAX_WAIT_MS for MICROBATCH_MAX_SIZE rows,
+runs one predict_proba over the stacked feature matrix and resolves every
+waiting request with its own row. Early-exit requests (EARLY_EXIT or
+?early_exit=1, as on the Flask route) skip the micro-batch and are evaluated
+on their own. When MICROBATCH_QUEUE_DEPTH requests are
+already waiting, new ones are rejected with 429. Every other route is served
+by the Flask app through asgiref's WSGI adapter.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:application
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import numpy as np
+
+import app as api
+
+MICROBATCH_MAX_SIZE = int(os.environ.get('MICROBATCH_MAX_SIZE', 64))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get('MICROBATCH_MAX_WAIT_MS', 2))
+MICROBATCH_QUEUE_DEPTH = int(os.environ.get('MICROBATCH_QUEUE_DEPTH', 1024))
+
+
+class QueueFullError(Exception):
+    """Raised when the micro-batch queue cannot accept another request"""
+
+
+class MicroBatcher:
+    """Collects single rows from concurrent requests into one model call"""
+
+    def __init__(self, max_batch_size=64, max_wait=0.002, queue_depth=1024):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue_depth = queue_depth
+        self._queue = None
+        self._batch_ready = None
+        self._task = None
+        self.batches = 0
+        self.rows = 0
+        self.rejected = 0
+
+    def start(self):
+        """Start the scheduler task on the running event loop"""
+        self._queue = asyncio.Queue(maxsize=self.queue_depth)
+        self._batch_ready = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def submit(self, features):
+        """Queue one feature row and return a future for its probabilities"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((features, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f'Prediction queue is full ({self.queue_depth} requests waiting)')
+        if self._queue.qsize() >= self.max_batch_size:
+            self._batch_ready.set()
+        return future
+
+    async def _collect(self):
+        """Wait for the first row, then up to max_wait for the batch to fill"""
+        batch = [await self._queue.get()]
+        if self._queue.qsize() < self.max_batch_size - 1:
+            self._batch_ready.clear()
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Requests whose client went away don't need a row in the matrix
+            batch = [(features, future) for features, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            features = np.vstack([row for row, _ in batch])
+            # Read the global on every batch so a reloaded model is picked up
+            current_model = api.model
+            try:
+                probabilities = await loop.run_in_executor(None, current_model.predict_proba, features)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.rows += len(batch)
+            for (_, future), row in zip(batch, probabilities):
+                if not future.done():
+                    future.set_result((api.class_labels(current_model), row))
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self.queue_depth,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'batches': self.batches,
+            'rows': self.rows,
+            'mean_batch_size': self.rows / self.batches if self.batches else 0.0,
+            'rejected': self.rejected,
+        }
+
+
+batcher = MicroBatcher(
+    max_batch_size=MICROBATCH_MAX_SIZE,
+    max_wait=MICROBATCH_MAX_WAIT_MS / 1000,
+    queue_depth=MICROBATCH_QUEUE_DEPTH
+)
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+    flask_application = WsgiToAsgi(api.app)
+except ImportError:
+    flask_application = None
+
+
+async def _read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def _send_json(send, scope, payload, status=200):
+    body = json.dumps(payload).encode()
+    origin = dict(scope['headers']).get(b'origin', b'*')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'access-control-allow-origin', origin),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+    return status
+
+
+async def predict(scope, receive, send):
+    """Micro-batched equivalent of the Flask /predict endpoint"""
+    # Counted under the Flask endpoint's name, so /metrics reads the same in
+    # both serving modes
+    started = time.perf_counter()
+    status = await _predict(scope, receive, send)
+    api.metrics.observe_request('predict', 'POST', status, time.perf_counter() - started)
+
+
+async def _predict(scope, receive, send):
+    """Answer one /predict request and return its status code"""
+    if api.model is None:
+        return await _send_json(send, scope, {'error': 'Model not loaded'}, 500)
+
+    stage_started = time.perf_counter()
+    try:
+        data = json.loads(await _read_body(receive))
+        stage_started = api.metrics.observe_stage('parse', stage_started)
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object')
+        for field in api.required_fields:
+            if field not in data:
+                return await _send_json(send, scope, {'error': f'Missing field: {field}'}, 400)
+        stage_started = api.metrics.observe_stage('validate', stage_started)
+        features = api.preprocess_input(data)
+        stage_started = api.metrics.observe_stage('preprocess', stage_started)
+    except (TypeError, ValueError) as e:
+        return await _send_json(send, scope, {'error': f'Invalid input data: {str(e)}'}, 400)
+
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    early_exit_requested = query.get('early_exit', ['1' if api.EARLY_EXIT else '0'])[0].lower() in ('1', 'true', 'yes')
+    current_model = api.model
+    early_exit = early_exit_requested and hasattr(current_model, 'predict_proba_early_exit')
+    cache_key = api.prediction_cache.make_key(features)
+    if early_exit and cache_key is not None:
+        cache_key += b'early_exit'
+    cached = api.prediction_cache.get(cache_key)
+    stage_started = api.metrics.observe_stage('cache', stage_started)
+    trees_evaluated = 0
+    if cached is not None:
+        class_index, confidence = cached
+        labels = api.class_labels(current_model)
+    elif early_exit:
+        # Rows stop after different numbers of trees, so they are evaluated
+        # one by one rather than in the micro-batch
+        try:
+            probabilities, trees = await asyncio.get_running_loop().run_in_executor(
+                None, current_model.predict_proba_early_exit, features, api.EARLY_EXIT_CHUNK,
+                api.EARLY_EXIT_CONFIDENCE)
+        except Exception as e:
+            return await _send_json(send, scope, {'error': f'Prediction failed: {str(e)}'}, 500)
+        labels = api.class_labels(current_model)
+        probabilities, trees_evaluated = probabilities[0], int(trees[0])
+        api.early_exit_stats.record(trees_evaluated, current_model.n_estimators)
+        class_index = int(probabilities.argmax())
+        confidence = float(probabilities[class_index])
+        api.prediction_cache.put(cache_key, (class_index, confidence))
+        stage_started = api.metrics.observe_stage('model', stage_started)
+    else:
+        if not batcher.running:
+            batcher.start()
+        try:
+            labels, probabilities = await batcher.submit(features)
+        except QueueFullError as e:
+            return await _send_json(send, scope, {'error': str(e)}, 429)
+        except Exception as e:
+            return await _send_json(send, scope, {'error': f'Prediction failed: {str(e)}'}, 500)
+        class_index = int(probabilities.argmax())
+        confidence = float(probabilities[class_index])
+        api.prediction_cache.put(cache_key, (class_index, confidence))
+        # Includes the wait for the micro-batch to fill
+        stage_started = api.metrics.observe_stage('model', stage_started)
+    monitor = api.drift_monitor
+    if monitor is not None:
+        monitor.observe(features, (class_index,), labels)
+
+    result = {
+        'prediction': labels[class_index],
+        'confidence': confidence,
+        'timestamp': datetime.now().isoformat()
+    }
+    if early_exit_requested:
+        # null when the serving engine has no early exit
+        result['trees_evaluated'] = trees_evaluated if early_exit else None
+    if query.get('echo', ['true'])[0].lower() not in ('0', 'false', 'no'):
+        result['input_data'] = data
+    status = await _send_json(send, scope, result)
+    api.metrics.observe_stage('serialize', stage_started)
+    return status
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            batcher.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await batcher.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        return await lifespan(scope, receive, send)
+
+    if scope['type'] == 'http' and scope['path'] == '/predict' and scope['method'] == 'POST':
+        return await predict(scope, receive, send)
+
+    if scope['type'] == 'http' and scope['path'] == '/predict/microbatch-stats':
+        return await _send_json(send, scope, batcher.stats())
+
+    if flask_application is None:
+        return await _send_json(send, scope, {'error': 'Not found (install asgiref to serve Flask routes)'}, 404)
+    return await flask_application(scope, receive, send)
@@ -0,0 +1,135 @@
+"""
+Streaming bulk classification of CSV and NDJSON vehicle files
+
+Records are parsed one line at a time and grouped into fixed-size chunks, and
+each chunk is classified with a single predict_proba call. Results are
+produced as NDJSON lines in input order, so memory use depends on the chunk
+size and not on the size of the file. Used by the /predict/stream endpoint
+and the classify_file.py command line tool.
+"""
+
+import csv
+import json
+from itertools import islice
+
+import numpy as np
+
+# Content types accepted for NDJSON input, besides anything containing "csv"
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl',
+                    'application/x-jsonlines', 'application/jsonlines')
+
+
+class InvalidRecord:
+    """Placeholder for an input line that could not be parsed"""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def detect_format(mimetype, requested=None):
+    """Return 'csv' or 'ndjson' for an explicit format or a content type"""
+    if requested:
+        if requested not in ('csv', 'ndjson'):
+            raise ValueError(f'Unsupported format: {requested} (use csv or ndjson)')
+        return requested
+    mimetype = (mimetype or '').lower()
+    if 'csv' in mimetype:
+        return 'csv'
+    if mimetype in NDJSON_MIMETYPES:
+        return 'ndjson'
+    raise ValueError(f'Unsupported content type: {mimetype or "none"} (send text/csv or application/x-ndjson)')
+
+
+def iter_text_lines(stream, encoding='utf-8'):
+    """Decode a binary stream line by line, dropping a leading byte order mark"""
+    first = True
+    for line in stream:
+        text = line.decode(encoding)
+        if first:
+            text = text.removeprefix('\ufeff')
+            first = False
+        yield text
+
+
+def iter_csv_records(lines, required_fields):
+    """Vehicles from CSV lines with a header row; extra columns are kept.
+
+    The header is read and checked straight away, so a file without the
+    required columns fails before any results are produced.
+    """
+    reader = csv.DictReader(lines)
+    header = reader.fieldnames or []
+    missing = [field for field in required_fields if field not in header]
+    if missing:
+        raise ValueError(f'Missing CSV column(s): {", ".join(missing)}')
+    return _csv_rows(reader)
+
+
+def _csv_rows(reader):
+    for row in reader:
+        # Empty cells count as missing rather than as invalid values
+        yield {key: (value if value != '' else None) for key, value in row.items()}
+
+
+def iter_ndjson_records(lines):
+    """Vehicles from NDJSON lines; blank lines are skipped"""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield InvalidRecord(f'Invalid JSON on line {line_number}: {e}')
+
+
+def iter_chunks(records, chunk_size):
+    """Group an iterable of records into lists of at most chunk_size"""
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def classify_chunks(model, labels, chunks, preprocess, id_field=None, stats=None):
+    """Yield one NDJSON text block per chunk, one result line per record.
+
+    ``labels`` are the model's class names in predict_proba column order and
+    ``preprocess`` is ``app.preprocess_batch``. Rows keep their position in the
+    input as ``index``; with ``id_field`` that field is copied to ``id`` so
+    results can be joined back to the source. A ``stats`` dict, if given, is
+    kept updated with the number of rows and errors written so far.
+    """
+    offset = 0
+    for chunk in chunks:
+        records = [None if isinstance(record, InvalidRecord) else record for record in chunk]
+        features, row_index, errors = preprocess(records)
+        for i, record in enumerate(chunk):
+            if isinstance(record, InvalidRecord):
+                errors[i] = record.message
+
+        predictions = {}
+        if len(row_index):
+            probabilities = model.predict_proba(features)
+            best = probabilities.argmax(axis=1)
+            confidences = probabilities[np.arange(len(best)), best].tolist()
+            predictions = dict(zip(row_index.tolist(), zip(best.tolist(), confidences)))
+
+        lines = []
+        for i, record in enumerate(chunk):
+            result = {'index': offset + i}
+            if id_field and isinstance(record, dict):
+                result['id'] = record.get(id_field)
+            if i in errors:
+                result['error'] = errors[i]
+            else:
+                class_index, confidence = predictions[i]
+                result['prediction'] = labels[class_index]
+                result['confidence'] = confidence
+            lines.append(json.dumps(result))
+        offset += len(chunk)
+        if stats is not None:
+            stats['rows'] = stats.get('rows', 0) + len(chunk)
+            stats['errors'] = stats.get('errors', 0) + len(errors)
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,106 @@
+"""
+Two-stage cascade over vehicle families
+
+A single coarse tree first picks the family (two-wheeler, car, SUV,
+commercial, bus). Rows it is confident about go to that family's small forest,
+which only has to tell a handful of subtypes apart; the rest fall back to the
+full forest. The artifact is written by ``create_model.py cascade`` and holds
+the coarse tree and every family forest in the compiled forest layout, each
+under its own key prefix.
+"""
+
+import threading
+
+import numpy as np
+
+from compiled_forest import SMALL_BATCH_ROWS, CompiledForest, read_arrays
+
+
+class CascadeForest:
+    """predict/predict_proba over the full class list, computed stage by stage"""
+
+    def __init__(self, arrays, fallback, min_confidence=None):
+        self.coarse = CompiledForest(_prefixed(arrays, 'coarse'))
+        self.families = [str(family) for family in self.coarse.classes_]
+        self.family_forests = [CompiledForest(_prefixed(arrays, f'family_{i}')) for i in range(len(self.families))]
+        self.fallback = fallback
+        self.min_confidence = float(arrays['min_confidence']) if min_confidence is None else min_confidence
+
+        # The cascade answers over the fallback's classes, in its column order
+        self.classes_ = np.asarray(fallback.classes_)
+        self.n_features_in_ = self.coarse.n_features_in_
+        self.feature_columns = self.coarse.feature_columns
+        self.n_estimators = 1 + sum(forest.n_estimators for forest in self.family_forests)
+        column = {str(label): i for i, label in enumerate(self.classes_)}
+        self.family_columns = []
+        for family, forest in zip(self.families, self.family_forests):
+            missing = [str(label) for label in forest.classes_ if str(label) not in column]
+            if missing:
+                raise ValueError(f'Family {family} predicts classes the full model lacks: {missing}')
+            self.family_columns.append(np.array([column[str(label)] for label in forest.classes_]))
+
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.fallback_rows = 0
+        self.family_rows = dict.fromkeys(self.families, 0)
+
+    @classmethod
+    def load(cls, path, fallback, mmap_mode=None, min_confidence=None):
+        """Load a cascade saved by create_model.py; ``fallback`` is the full model"""
+        return cls(read_arrays(path, mmap_mode), fallback, min_confidence)
+
+    def _coarse_proba(self, X):
+        """Family probabilities from the coarse tree"""
+        if len(X) > SMALL_BATCH_ROWS:
+            return self.coarse.predict_proba(X)
+        # Walking one small tree as Python lists costs a fraction of the
+        # per-level overhead of the lockstep NumPy evaluation
+        leaves = [self.coarse.walk(row)[0] for row in X.tolist()]
+        proba = self.coarse.value[leaves].astype(np.float64)
+        if self.coarse.value_scale is not None:
+            proba *= self.coarse.value_scale
+        return proba
+
+    def predict_proba(self, X):
+        """Family forest probabilities, or the full forest's for unsure rows"""
+        X = np.asarray(X, dtype=np.float32)
+        family_proba = self._coarse_proba(X)
+        family = family_proba.argmax(axis=1)
+        unsure = family_proba[np.arange(len(X)), family] < self.min_confidence
+
+        proba = np.zeros((len(X), len(self.classes_)))
+        counts = {}
+        for i, forest in enumerate(self.family_forests):
+            rows = np.flatnonzero((family == i) & ~unsure)
+            if len(rows):
+                proba[np.ix_(rows, self.family_columns[i])] = forest.predict_proba(X[rows])
+                counts[self.families[i]] = len(rows)
+        if unsure.any():
+            proba[unsure] = self.fallback.predict_proba(X[unsure])
+
+        with self._lock:
+            self.rows += len(X)
+            self.fallback_rows += int(unsure.sum())
+            for name, count in counts.items():
+                self.family_rows[name] += count
+        return proba
+
+    def predict(self, X):
+        """Most probable class for each row"""
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'min_confidence': self.min_confidence,
+                'rows': self.rows,
+                'fallback_rows': self.fallback_rows,
+                'fallback_rate': self.fallback_rows / self.rows if self.rows else 0.0,
+                'family_rows': dict(self.family_rows),
+            }
+
+
+def _prefixed(arrays, prefix):
+    """The arrays stored under ``prefix__``, with the prefix removed"""
+    start = prefix + '__'
+    return {name[len(start):]: value for name, value in arrays.items() if name.startswith(start)}
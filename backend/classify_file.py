@@ -0,0 +1,76 @@
+"""
+Offline bulk classification of a CSV or NDJSON vehicle file
+
+Runs the same chunked pipeline as POST /predict/stream against the locally
+installed model and writes one NDJSON result per input row. Memory use is
+bounded by --chunk-size, so files of any size can be processed.
+
+Usage:
+    python classify_file.py fleet.csv -o predictions.ndjson
+    python classify_file.py vehicles.ndjson --id-field registration > predictions.ndjson
+    zcat fleet.csv.gz | python classify_file.py - --format csv -o predictions.ndjson
+"""
+
+import argparse
+import os
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help="CSV or NDJSON file, or - for stdin")
+    parser.add_argument('-o', '--output', default='-', help="Where to write NDJSON results (default stdout)")
+    parser.add_argument('--format', choices=['csv', 'ndjson'],
+                        help="Input format (default: from the file extension)")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Rows per model call")
+    parser.add_argument('--id-field', help="Input field copied to each result as id")
+    args = parser.parse_args()
+
+    input_format = args.format
+    if input_format is None:
+        extension = os.path.splitext(args.input)[1].lower()
+        input_format = 'csv' if extension == '.csv' else 'ndjson' if extension in ('.ndjson', '.jsonl') else None
+    if input_format is None:
+        parser.error("cannot tell the input format from the file name; pass --format")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be positive")
+
+    # The app logs to stdout, which may be carrying the results
+    os.environ.setdefault('LOG_LEVEL', 'ERROR')
+    os.environ.setdefault('PREDICTION_CACHE_SIZE', '0')
+    import app
+    import bulk_classify
+
+    if app.model is None:
+        sys.exit("No model could be loaded")
+
+    source = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')
+    destination = sys.stdout if args.output == '-' else open(args.output, 'w')
+    started = time.perf_counter()
+    stats = {'rows': 0, 'errors': 0}
+    try:
+        lines = bulk_classify.iter_text_lines(source)
+        if input_format == 'csv':
+            records = bulk_classify.iter_csv_records(lines, app.required_fields)
+        else:
+            records = bulk_classify.iter_ndjson_records(lines)
+        chunks = bulk_classify.iter_chunks(records, args.chunk_size)
+        for block in bulk_classify.classify_chunks(app.model, app.class_labels(app.model), chunks,
+                                                   app.preprocess_batch, args.id_field, stats):
+            destination.write(block)
+    except ValueError as e:
+        sys.exit(f"Invalid input data: {e}")
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if destination is not sys.stdout:
+            destination.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Classified {stats['rows']} rows ({stats['errors']} errors) in {elapsed:.2f}s "
+          f"({stats['rows'] / elapsed if elapsed else 0:.0f} rows/s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Array-backed Random Forest evaluator
+
+Serves the flattened forest written by ``model/create_model.py`` (see
+``compile_forest``) without going through sklearn. Every tree is evaluated for
+the whole batch in lockstep with plain NumPy indexing, and the probabilities
+are accumulated in the same order as ``RandomForestClassifier.predict_proba``
+so the results match it exactly.
+
+The artifact is an uncompressed, versioned .npz archive. Loading it needs
+neither sklearn nor joblib, and with ``mmap_mode='r'`` the arrays are mapped
+straight from the file so forked workers share them through the page cache.
+The compact variant (``create_model.py compress``) stores float32 thresholds,
+uint8 class distributions scaled by ``value_scale`` and narrow index types;
+it is evaluated by the same code.
+
+``predict_proba_early_exit`` trades exactness for latency: it evaluates the
+trees a chunk at a time and stops as soon as the answer is settled.
+"""
+
+import struct
+import zipfile
+
+import numpy as np
+
+# Bump together with COMPILED_FORMAT_VERSION in model/create_model.py.
+# Version 2 added the optional quantized leaf values; version 1 files have
+# none, so they are still read.
+FORMAT_VERSION = 2
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+
+# Up to this many rows, trees are walked in plain Python rather than in lockstep
+SMALL_BATCH_ROWS = 16
+
+
+def _mmap_npz(path):
+    """Memory-map every array stored in an uncompressed .npz archive"""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f'Cannot memory-map compressed member {info.filename} of {path}')
+            # Skip the member's local file header to reach the .npy payload
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')]
+            if not shape:
+                # Scalars are cheaper to read than to map
+                arrays[name] = np.frombuffer(f.read(dtype.itemsize), dtype=dtype)[0]
+            else:
+                mapped = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                   order='F' if fortran_order else 'C')
+                # A plain ndarray view avoids memmap subclass overhead when indexing
+                arrays[name] = mapped.view(np.ndarray)
+    return arrays
+
+
+def read_arrays(path, mmap_mode=None):
+    """All arrays of a compiled artifact, after checking its format version"""
+    if mmap_mode:
+        arrays = _mmap_npz(path)
+    else:
+        with np.load(path, allow_pickle=False) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+    version = int(arrays.get('format_version', 0))
+    if version not in SUPPORTED_FORMAT_VERSIONS:
+        raise ValueError(f'{path} has format version {version}, expected one of {SUPPORTED_FORMAT_VERSIONS}; '
+                         f're-export it with create_model.py export')
+    return arrays
+
+
+class CompiledForest:
+    """Drop-in replacement for the fitted forest's predict/predict_proba"""
+
+    def __init__(self, arrays):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.max_depth = int(arrays['max_depth'])
+        self.classes_ = np.asarray(arrays['classes'])
+        self.class_labels = [str(label) for label in self.classes_]
+        self.n_features_in_ = int(arrays['n_features'])
+        # Column order the forest was trained on; older exports don't record it
+        self.feature_columns = arrays['feature_columns'].tolist() if 'feature_columns' in arrays else None
+        self.n_estimators = len(self.roots)
+        # Quantized class distributions are integers to be multiplied by this
+        self.value_scale = float(arrays['value_scale']) if 'value_scale' in arrays else None
+        # Python copies of the tree arrays, built on first use by walk()
+        self._nodes = None
+        self._root_list = None
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Load a compiled forest saved by create_model.py"""
+        return cls(read_arrays(path, mmap_mode))
+
+    def apply(self, X, roots=None):
+        """Return the leaf reached in every tree, shape (n_samples, n_trees).
+
+        ``roots`` restricts the walk to a subset of the trees.
+        """
+        # Trees compare float32 inputs against float64 thresholds, like sklearn
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f'Expected {self.n_features_in_} features, got shape {X.shape}')
+
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        node = np.tile(self.roots if roots is None else roots, (X.shape[0], 1))
+
+        # Leaves point to themselves, so walking max_depth levels lands every
+        # row on its leaf without tracking which trees are finished
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return node
+
+    def predict_proba(self, X):
+        """Mean of the per-tree class distributions"""
+        leaves = self.apply(X)
+        # Summing over the leading tree axis adds the trees one after another,
+        # the same accumulation order sklearn uses
+        if self.value_scale is not None:
+            proba = self.value[leaves.T].sum(axis=0, dtype=np.float64)
+            proba *= self.value_scale / self.n_estimators
+            return proba
+        proba = self.value[leaves.T].sum(axis=0)
+        proba /= self.n_estimators
+        return proba
+
+    def walk(self, row, start=0, stop=None):
+        """Leaves reached by one row (a list of floats) in trees start:stop.
+
+        Plain Python: the lockstep NumPy walk costs a few microseconds per tree
+        level however few rows and trees it is given, while following one
+        row's path through a tree costs a fraction of that.
+        """
+        if self._nodes is None:
+            # float32 values converted to Python floats compare exactly as before
+            self._root_list = self.roots.tolist()
+            self._nodes = list(zip(self.feature.tolist(), self.threshold.tolist(),
+                                   self.left.tolist(), self.right.tolist()))
+        nodes = self._nodes
+        leaves = []
+        for node in self._root_list[start:stop]:
+            feature, threshold, left, right = nodes[node]
+            while left != node:
+                node = left if row[feature] <= threshold else right
+                feature, threshold, left, right = nodes[node]
+            leaves.append(node)
+        return leaves
+
+    def predict_proba_early_exit(self, X, chunk_size=10, min_confidence=None):
+        """Mean class distribution over the trees needed to settle each row.
+
+        Trees are evaluated chunk_size at a time. A row stops once its leading
+        class is further ahead of the runner-up than the remaining trees could
+        make up, which leaves the predicted class unchanged, or, with
+        ``min_confidence``, once the leader's mean probability so far reaches
+        it. Returns the probabilities and the number of trees evaluated for
+        each row.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f'Expected {self.n_features_in_} features, got shape {X.shape}')
+        chunk_size = max(1, int(chunk_size))
+        n_trees = self.n_estimators
+        # Every tree's class distribution sums to one, in stored units
+        one_tree = 1.0 if self.value_scale is None else 1.0 / self.value_scale
+
+        def settled(total, evaluated):
+            """Which rows of the running totals need no more trees"""
+            remaining = n_trees - evaluated
+            if remaining == 0 or total.shape[1] < 2:
+                return np.ones(len(total), dtype=bool)
+            top = np.partition(total, -2, axis=1)[:, -2:]
+            done = top[:, 1] - top[:, 0] > remaining * one_tree
+            if min_confidence is not None:
+                done |= top[:, 1] >= min_confidence * evaluated * one_tree
+            return done
+
+        total = np.zeros((len(X), len(self.classes_)))
+        trees_evaluated = np.zeros(len(X), dtype=np.int64)
+        if len(X) <= SMALL_BATCH_ROWS:
+            for i, row in enumerate(X.tolist()):
+                for start in range(0, n_trees, chunk_size):
+                    stop = min(start + chunk_size, n_trees)
+                    total[i] += self.value[self.walk(row, start, stop)].sum(axis=0, dtype=np.float64)
+                    trees_evaluated[i] = stop
+                    if settled(total[i:i + 1], stop)[0]:
+                        break
+        else:
+            active = np.arange(len(X))
+            for start in range(0, n_trees, chunk_size):
+                stop = min(start + chunk_size, n_trees)
+                leaves = self.apply(X[active], self.roots[start:stop])
+                total[active] += self.value[leaves.T].sum(axis=0, dtype=np.float64)
+                trees_evaluated[active] = stop
+                active = active[~settled(total[active], stop)]
+                if not len(active):
+                    break
+
+        total /= trees_evaluated[:, np.newaxis] * one_tree
+        return total, trees_evaluated
+
+    def predict(self, X):
+        """Most probable class for each row"""
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
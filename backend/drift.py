@@ -0,0 +1,183 @@
+"""
+Constant-memory input and prediction statistics for drift detection
+
+Request threads only put their feature rows and predicted classes on a
+bounded queue. A background thread drains it in batches and adds them to
+fixed-size histograms, one per feature column in the bins saved with the
+training statistics (see model/feature_stats.py), plus fuel type and
+predicted class counts. Memory use does not grow with traffic, and when the
+aggregator falls behind rows are dropped and counted rather than slowing
+requests down.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from feature_stats import bin_indices, drift_status, population_stability
+
+# A child of the API logger, so warnings go through its JSON queue handler
+logger = logging.getLogger('vehicle_api.drift')
+
+# Statuses are only reported once this many rows have been seen
+MIN_ROWS = 100
+# Rows folded into the histograms per aggregator pass, at most
+_DRAIN_ROWS = 4096
+# Pause between passes, so rows are binned in batches rather than one by one
+_DRAIN_INTERVAL = 0.05
+# Queued by stop() to end the aggregator thread
+_STOP = None
+
+
+class DriftMonitor:
+    """Histograms of production inputs compared with the training distribution"""
+
+    def __init__(self, statistics, queue_depth=10000):
+        self.statistics = statistics
+        self.feature_columns = statistics['feature_columns']
+        self.fuel_types = list(statistics['fuel_types'])
+        self._features = [statistics['features'][name] for name in self.feature_columns]
+        self._fuel_columns = [self.feature_columns.index(f'fuel_type_{fuel}') for fuel in self.fuel_types]
+        self.queue_depth = queue_depth
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._thread = None
+        self._stopped = False
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [np.zeros(len(feature['cuts']) + 3, dtype=np.int64) for feature in self._features]
+            self.fuel_counts = np.zeros(len(self.fuel_types), dtype=np.int64)
+            self.class_counts = {}
+            self.rows = 0
+            self.dropped = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the aggregator thread; also called after a fork, where it does not survive"""
+        self._thread = threading.Thread(target=self._run, name='drift-aggregator', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Let the aggregator fold in what is queued and exit; observe() then drops rows"""
+        with self._start_lock:
+            self._stopped = True
+            if self.running:
+                self._queue.put(_STOP)
+
+    def observe(self, features, class_index, labels):
+        """Queue feature rows with their predicted class indices into ``labels``"""
+        if not self.running:
+            with self._start_lock:
+                if self._stopped:
+                    return
+                if not self.running:
+                    self.start()
+        try:
+            self._queue.put_nowait((features, class_index, labels))
+        except queue.Full:
+            with self._lock:
+                self.dropped += len(features)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            rows = 0
+            item = self._queue.get()
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                rows += len(item[0])
+                if rows >= _DRAIN_ROWS:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._add(batch)
+                except Exception:
+                    logger.exception("Could not update drift statistics")
+            if not stopping:
+                time.sleep(_DRAIN_INTERVAL)
+
+    def _add(self, batch):
+        features = np.vstack([item[0] for item in batch])
+        bins = [np.bincount(bin_indices(feature, features[:, j]), minlength=len(self.counts[j]))
+                for j, feature in enumerate(self._features)]
+        fuel = np.bincount(features[:, self._fuel_columns].argmax(axis=1), minlength=len(self.fuel_types))
+        predicted = {}
+        for _, class_index, labels in batch:
+            for index in class_index:
+                label = labels[index]
+                predicted[label] = predicted.get(label, 0) + 1
+        with self._lock:
+            for counts, new in zip(self.counts, bins):
+                counts += new
+            self.fuel_counts += fuel
+            for label, count in predicted.items():
+                self.class_counts[label] = self.class_counts.get(label, 0) + count
+            self.rows += len(features)
+
+    def report(self):
+        """Observed distributions next to the training ones, with a PSI per feature.
+
+        Histograms have a bin below the training minimum, one bin per
+        interval between ``cuts`` and one above the training maximum.
+        """
+        with self._lock:
+            rows = self.rows
+            counts = [c.copy() for c in self.counts]
+            fuel_counts = self.fuel_counts.copy()
+            class_counts = dict(self.class_counts)
+            dropped = self.dropped
+        judged = rows >= MIN_ROWS
+
+        features = {}
+        for name, feature, observed in zip(self.feature_columns, self._features, counts):
+            fractions = observed / rows if rows else np.zeros(len(observed))
+            psi = population_stability(feature['fractions'], fractions) if rows else 0.0
+            features[name] = {
+                'psi': psi,
+                'status': drift_status(psi) if judged else None,
+                'below_training_range': float(fractions[0]),
+                'above_training_range': float(fractions[-1]),
+                'cuts': feature['cuts'].tolist(),
+                'histogram': observed.tolist(),
+                'training_fractions': feature['fractions'],
+            }
+
+        def compare(training, observed):
+            names = sorted(set(training) | set(observed))
+            fractions = {name: observed.get(name, 0) / rows if rows else 0.0 for name in names}
+            psi = population_stability([training.get(name, 0.0) for name in names],
+                                       [fractions[name] for name in names]) if rows else 0.0
+            return {'psi': psi, 'status': drift_status(psi) if judged else None,
+                    'observed': fractions, 'training': training}
+
+        fuel = compare(self.statistics['fuel_types'], dict(zip(self.fuel_types, fuel_counts.tolist())))
+        classes = compare(self.statistics['classes'], class_counts)
+        return {
+            'rows': rows,
+            'dropped': dropped,
+            'queued': self._queue.qsize(),
+            'training_rows': self.statistics['rows'],
+            'drifted': sorted(name for name, result in
+                              list(features.items()) + [('fuel_type', fuel), ('prediction', classes)]
+                              if result['status'] == 'drift'),
+            'features': features,
+            'fuel_type': fuel,
+            'prediction': classes,
+        }
@@ -0,0 +1,61 @@
+"""
+Gunicorn configuration for production serving
+
+The app is imported once in the master (``preload_app``), so ``load_model()``
+runs before the workers are forked and every worker shares the model's memory
+copy-on-write. With ``MODEL_ENGINE=compiled`` and ``MODEL_MMAP=1`` the tree
+arrays are memory-mapped read-only from disk and shared through the page cache.
+
+Environment variables:
+    PORT              port to bind (default 5000)
+    WEB_CONCURRENCY   number of worker processes (default 1)
+    GUNICORN_TIMEOUT  worker timeout in seconds (default 120)
+"""
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = True
+
+
+def memory_status():
+    """Resident memory of this process in MB, split into shared and private pages"""
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as rollup:
+            for line in rollup:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty'):
+                    fields[key] = int(value.split()[0]) / 1024
+    except OSError:
+        # smaps_rollup is Linux only; skip the report elsewhere
+        return None
+    return {
+        'rss': fields.get('Rss', 0.0),
+        'pss': fields.get('Pss', 0.0),
+        'shared': fields.get('Shared_Clean', 0.0) + fields.get('Shared_Dirty', 0.0),
+        'private': fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0),
+    }
+
+
+def _format_memory(memory):
+    if memory is None:
+        return 'RSS unavailable'
+    return (f"RSS {memory['rss']:.1f} MB (shared {memory['shared']:.1f} MB, "
+            f"private {memory['private']:.1f} MB, PSS {memory['pss']:.1f} MB)")
+
+
+def when_ready(server):
+    """Report the master's footprint once the preloaded model is in memory"""
+    # Move everything allocated so far out of the GC's reach so collections in
+    # the workers don't write to (and un-share) the inherited pages
+    gc.freeze()
+    server.log.info("Master ready with %d worker(s), %s", workers, _format_memory(memory_status()))
+
+
+def post_worker_init(worker):
+    """Startup check: report each worker's resident memory after fork"""
+    worker.log.info("Worker %s ready, %s", worker.pid, _format_memory(memory_status()))
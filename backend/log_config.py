@@ -0,0 +1,77 @@
+"""
+Structured, queue-based logging for the API
+
+Request threads only put log records on a queue; a background QueueListener
+thread formats them as one JSON object per line and writes them to stdout.
+The level comes from LOG_LEVEL (default INFO). Per-request messages are
+logged at DEBUG, so they cost nothing on the hot path unless enabled.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+_queue_handler = None
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as a single JSON line, merging any ``fields`` extra"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        return json.dumps(entry, default=str)
+
+
+def _start_listener():
+    global _listener
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler)
+    _listener.start()
+
+
+def _restart_listener_after_fork():
+    # The listener thread does not survive fork (gunicorn preloads the app in
+    # the master), so each child gets a fresh queue and its own writer thread
+    if _queue_handler is not None:
+        _queue_handler.queue = queue.SimpleQueue()
+        _start_listener()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def configure_logging(name='vehicle_api'):
+    """Return the API logger, attaching the queue handler on first use"""
+    global _queue_handler
+    logger = logging.getLogger(name)
+    if _queue_handler is not None:
+        return logger
+
+    logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    logger.propagate = False
+
+    _queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    logger.addHandler(_queue_handler)
+    _start_listener()
+
+    atexit.register(_stop_listener)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+    return logger
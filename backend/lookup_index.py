@@ -0,0 +1,138 @@
+"""
+Precomputed decision lookup index in front of a compiled forest
+
+A forest only ever compares a feature with its own split thresholds, so two
+inputs whose features fall between the same pair of thresholds, feature by
+feature, reach the same leaves and get exactly the same probabilities. The
+index written by ``create_model.py index`` turns each feature into the
+number of thresholds below it, packs those bucket numbers into one integer
+key per cell, and stores the probabilities of every cell seen in a large
+sample of synthetic traffic. Serving a row is then a binary search per
+feature plus one search in the sorted key array; rows in cells the index
+does not cover are answered by the forest itself.
+"""
+
+import bisect
+import threading
+
+import numpy as np
+
+from compiled_forest import SMALL_BATCH_ROWS, read_arrays
+
+
+def cell_keys(cuts, radix, X):
+    """Key of the cell of every row of X, given each feature's sorted thresholds"""
+    # Trees compare float32 inputs, and x <= t sends a row left, so a row's
+    # bucket is the number of thresholds strictly below it
+    X = np.asarray(X, dtype=np.float32)
+    keys = np.zeros(len(X), dtype=np.uint64)
+    for j, (feature_cuts, multiplier) in enumerate(zip(cuts, radix)):
+        keys += np.searchsorted(feature_cuts, X[:, j], side='left').astype(np.uint64) * np.uint64(multiplier)
+    return keys
+
+
+def read_source_sha256(path):
+    """sha256 of the artifact an index was built from, read without loading the index"""
+    # np.load reads the members of an .npz archive lazily
+    with np.load(path, allow_pickle=False) as archive:
+        return str(archive['source_sha256'])
+
+
+class LookupIndex:
+    """predict/predict_proba from the index, falling back to the forest it was built from"""
+
+    def __init__(self, arrays, fallback):
+        offsets = arrays['cut_offsets']
+        self.cuts = [arrays['cuts'][start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+        self.radix = arrays['radix']
+        self.keys = arrays['keys']
+        self.rows = arrays['rows']
+        self.proba = arrays['proba']
+        self.source_sha256 = str(arrays['source_sha256'])
+        self.fallback = fallback
+
+        if [str(label) for label in arrays['classes']] != [str(label) for label in fallback.classes_]:
+            raise ValueError('Lookup index was built for other classes than the serving model')
+        self.classes_ = np.asarray(fallback.classes_)
+        self.n_features_in_ = fallback.n_features_in_
+        self.feature_columns = getattr(fallback, 'feature_columns', None)
+        self.n_estimators = getattr(fallback, 'n_estimators', None)
+        if len(self.cuts) != self.n_features_in_:
+            raise ValueError(f'Lookup index has {len(self.cuts)} features, the model {self.n_features_in_}')
+
+        # Single rows are bucketed with bisect on Python lists, which is
+        # cheaper than a NumPy call per feature
+        self._cut_lists = [feature_cuts.tolist() for feature_cuts in self.cuts]
+        self._radix_list = [int(multiplier) for multiplier in self.radix]
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path, fallback, mmap_mode=None):
+        """Load an index saved by create_model.py; ``fallback`` is the forest it was built from"""
+        return cls(read_arrays(path, mmap_mode), fallback)
+
+    def _keys(self, X):
+        if len(X) > SMALL_BATCH_ROWS:
+            return cell_keys(self.cuts, self.radix, X)
+        keys = []
+        # float32 values converted to Python floats compare exactly as before
+        for row in X.tolist():
+            key = 0
+            for value, feature_cuts, multiplier in zip(row, self._cut_lists, self._radix_list):
+                key += bisect.bisect_left(feature_cuts, value) * multiplier
+            keys.append(key)
+        return np.array(keys, dtype=np.uint64)
+
+    def _lookup(self, X):
+        """Probabilities of the rows in covered cells, and which rows those are"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f'Expected {self.n_features_in_} features, got shape {X.shape}')
+        keys = self._keys(X)
+        position = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        hit = self.keys[position] == keys
+
+        proba = np.empty((len(X), len(self.classes_)))
+        proba[hit] = self.proba[self.rows[position[hit]]]
+        misses = len(X) - int(hit.sum())
+        with self._lock:
+            self.hits += len(X) - misses
+            self.misses += misses
+        return X, proba, hit
+
+    def predict_proba(self, X):
+        """Stored probabilities of each row's cell, or the forest's for uncovered cells"""
+        X, proba, hit = self._lookup(X)
+        if not hit.all():
+            proba[~hit] = self.fallback.predict_proba(X[~hit])
+        return proba
+
+    def predict_proba_early_exit(self, X, chunk_size=10, min_confidence=None):
+        """predict_proba_early_exit of the forest for uncovered cells only.
+
+        Rows in covered cells get their stored probabilities and count as
+        having evaluated no trees.
+        """
+        X, proba, hit = self._lookup(X)
+        trees_evaluated = np.zeros(len(X), dtype=np.int64)
+        if not hit.all():
+            proba[~hit], trees_evaluated[~hit] = self.fallback.predict_proba_early_exit(
+                X[~hit], chunk_size, min_confidence)
+        return proba, trees_evaluated
+
+    def predict(self, X):
+        """Most probable class for each row"""
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def stats(self):
+        with self._lock:
+            rows = self.hits + self.misses
+            return {
+                'cells': len(self.keys),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / rows if rows else 0.0,
+            }
@@ -0,0 +1,205 @@
+"""
+Low-overhead request metrics in Prometheus text format
+
+Histograms keep fixed bucket counts, so recording a value is one bisect and a
+few integer updates under a lock. Everything is per process: with several
+gunicorn workers each worker reports its own numbers.
+"""
+
+import bisect
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+from collections import defaultdict
+
+# Upper bounds in seconds, from 50 microseconds to 5 seconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{str(value)}"'.replace('\n', ' ') for key, value in labels)
+    return '{' + pairs + '}'
+
+
+class Histogram:
+    """Fixed-bucket histogram with running sum and count"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, labels=()):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+        lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {count}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+class Metrics:
+    """Request counters and latency histograms for the API"""
+
+    def __init__(self, prefix='vehicle_api'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.request_duration = {}
+        self.stage_duration = {}
+
+    def _histogram(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(key, Histogram())
+        return histogram
+
+    def observe_stage(self, stage, started):
+        """Record the time since started for a /predict stage and return now"""
+        now = time.perf_counter()
+        self._histogram(self.stage_duration, stage).observe(now - started)
+        return now
+
+    def observe_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+        if seconds is not None:
+            self._histogram(self.request_duration, endpoint).observe(seconds)
+
+    def render(self, gauges=()):
+        """Prometheus exposition text; gauges is a list of (name, help, value, labels)"""
+        p = self.prefix
+        lines = [f'# HELP {p}_requests_total HTTP requests by endpoint, method and status.',
+                 f'# TYPE {p}_requests_total counter']
+        with self._lock:
+            requests = dict(self.requests)
+        errors = defaultdict(int)
+        for (endpoint, method, status), count in sorted(requests.items(), key=str):
+            lines.append(f'{p}_requests_total'
+                         f'{_format_labels((("endpoint", endpoint), ("method", method), ("status", status)))} {count}')
+            if status >= 400:
+                errors[status] += count
+
+        lines += [f'# HELP {p}_errors_total HTTP error responses by status.',
+                  f'# TYPE {p}_errors_total counter']
+        for status, count in sorted(errors.items()):
+            lines.append(f'{p}_errors_total{_format_labels((("status", status),))} {count}')
+
+        lines += [f'# HELP {p}_request_duration_seconds Time spent handling a request.',
+                  f'# TYPE {p}_request_duration_seconds histogram']
+        for endpoint, histogram in sorted(self.request_duration.items(), key=str):
+            lines += histogram.render(f'{p}_request_duration_seconds', (('endpoint', endpoint),))
+
+        lines += [f'# HELP {p}_predict_stage_seconds Time spent in each stage of /predict.',
+                  f'# TYPE {p}_predict_stage_seconds histogram']
+        for stage, histogram in list(self.stage_duration.items()):
+            lines += histogram.render(f'{p}_predict_stage_seconds', (('stage', stage),))
+
+        described = set()
+        for name, help_text, value, labels in gauges:
+            if value is None:
+                continue
+            # One HELP/TYPE header per metric, however many label sets follow
+            if name not in described:
+                lines += [f'# HELP {p}_{name} {help_text}', f'# TYPE {p}_{name} gauge']
+                described.add(name)
+            lines.append(f'{p}_{name}{_format_labels(labels)} {float(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """cProfile a random fraction of requests and aggregate the results"""
+
+    def __init__(self, sample_rate=0.0):
+        self.sample_rate = sample_rate
+        self.sampled_requests = 0
+        self._stats = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Return a running profiler, or None when this request is not sampled"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this interpreter
+            return None
+        return profiler
+
+    def stop(self, profiler):
+        profiler.disable()
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profiler)
+            else:
+                self._stats.add(profiler)
+            self.sampled_requests += 1
+
+    def report(self, limit=30, sort='cumulative'):
+        """Top functions of all sampled requests as text"""
+        with self._lock:
+            if self._stats is None:
+                return 'No requests sampled yet\n'
+            output = io.StringIO()
+            self._stats.stream = output
+            output.write(f'{self.sampled_requests} sampled requests\n')
+            self._stats.sort_stats(sort).print_stats(limit)
+            return output.getvalue()
+
+    def reset(self):
+        with self._lock:
+            self._stats = None
+            self.sampled_requests = 0
+
+
+class EarlyExitStats:
+    """How many trees early-exit predictions evaluated out of those available"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.predictions = 0
+        self.early_exits = 0
+        self.trees_evaluated = 0
+        self.trees_available = 0
+
+    def record(self, trees_evaluated, n_trees):
+        with self._lock:
+            self.predictions += 1
+            self.early_exits += trees_evaluated < n_trees
+            self.trees_evaluated += trees_evaluated
+            self.trees_available += n_trees
+
+    def stats(self):
+        with self._lock:
+            return {
+                'predictions': self.predictions,
+                'early_exits': self.early_exits,
+                'trees_evaluated': self.trees_evaluated,
+                'trees_available': self.trees_available,
+                'mean_trees_evaluated': self.trees_evaluated / self.predictions if self.predictions else 0.0,
+                'saved_fraction': 1 - self.trees_evaluated / self.trees_available if self.trees_available else 0.0,
+            }
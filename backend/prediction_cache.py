@@ -0,0 +1,95 @@
+"""
+In-process LRU cache for single-vehicle predictions
+
+Entries are keyed on the preprocessed 12-value feature vector rounded to a
+configurable number of decimals, so repeated submissions of the same vehicle
+(or measurements that differ only in noise) skip the forest entirely.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PredictionCache:
+    """Size-bounded LRU cache with optional TTL and hit/miss/eviction counters"""
+
+    def __init__(self, maxsize=4096, ttl=0, decimals=3):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.decimals = decimals
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def make_key(self, features):
+        """Quantize a feature vector into a hashable cache key"""
+        if not self.enabled:
+            return None
+        # Adding 0.0 turns -0.0 into 0.0 so both round to the same key
+        quantized = np.round(np.asarray(features, dtype=np.float64).ravel(), self.decimals) + 0.0
+        return quantized.tobytes()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entries"""
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, e.g. when a new model is loaded"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """Counters for the /health endpoint"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'decimals': self.decimals,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
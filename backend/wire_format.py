@@ -0,0 +1,115 @@
+"""
+Compact request and response encodings for high-volume clients
+
+Besides JSON, /predict/compact accepts:
+
+    application/msgpack
+        The same vehicle object, list of vehicles or object of columns as
+        /predict/batch, MessagePack-encoded.
+
+    application/x-vehicle-features
+        Already encoded feature rows: the magic bytes ``VFM1``, the number of
+        rows and columns as little-endian uint32, then rows x columns
+        little-endian float32 values in row-major order, with the columns in
+        ``feature_columns`` order (fuel type one-hot encoded).
+
+Responses are chosen from the Accept header: JSON (default), MessagePack, or
+``application/x-vehicle-predictions``: ``VPR1``, the row count and the
+number of fields per row (2) as uint32, then one int16 class index per row
+(-1 for rejected rows) and one float32 confidence per row, all
+little-endian. Class indices refer to the ``classes`` list of /model-info for
+the ``model_version`` the response was made with.
+"""
+
+import struct
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+FEATURES = 'application/x-vehicle-features'
+PREDICTIONS = 'application/x-vehicle-predictions'
+
+MSGPACK_MIMETYPES = (MSGPACK, 'application/x-msgpack', 'application/vnd.msgpack')
+
+FEATURES_MAGIC = b'VFM1'
+PREDICTIONS_MAGIC = b'VPR1'
+_HEADER = struct.Struct('<4sII')
+
+
+class UnsupportedMediaType(ValueError):
+    """The request body is in a format this server cannot read"""
+
+
+def request_format(mimetype):
+    """Canonical name of the request body's format"""
+    mimetype = (mimetype or '').lower()
+    if mimetype in MSGPACK_MIMETYPES:
+        if msgpack is None:
+            raise UnsupportedMediaType('MessagePack support is not installed (pip install msgpack)')
+        return MSGPACK
+    if mimetype == FEATURES:
+        return FEATURES
+    if mimetype == JSON:
+        return JSON
+    raise UnsupportedMediaType(f'Unsupported content type: {mimetype or "none"}')
+
+
+def response_format(accept_mimetypes):
+    """Pick the response format from a werkzeug Accept header"""
+    offered = [JSON, PREDICTIONS] + ([MSGPACK] if msgpack is not None else [])
+    # Clients that accept none of these still get JSON
+    return accept_mimetypes.best_match(offered, default=JSON)
+
+
+def decode_msgpack(body):
+    return msgpack.unpackb(body, raw=False)
+
+
+def decode_features(body, n_features):
+    """Feature matrix of an application/x-vehicle-features body, without copying"""
+    if len(body) < _HEADER.size:
+        raise ValueError('Feature matrix is shorter than its header')
+    magic, rows, columns = _HEADER.unpack_from(body)
+    if magic != FEATURES_MAGIC:
+        raise ValueError(f'Bad feature matrix magic {magic!r}, expected {FEATURES_MAGIC!r}')
+    if columns != n_features:
+        raise ValueError(f'Expected {n_features} feature columns, got {columns}')
+    if len(body) != _HEADER.size + rows * columns * 4:
+        raise ValueError(f'Feature matrix of {rows}x{columns} float32 has {len(body) - _HEADER.size} payload bytes')
+    features = np.frombuffer(body, dtype='<f4', offset=_HEADER.size).reshape(rows, columns)
+    if not np.isfinite(features).all():
+        raise ValueError('Feature matrix contains NaN or infinite values')
+    return features
+
+
+def encode_features(features):
+    """Client-side counterpart of decode_features"""
+    features = np.ascontiguousarray(features, dtype='<f4')
+    return _HEADER.pack(FEATURES_MAGIC, *features.shape) + features.tobytes()
+
+
+def encode_predictions(class_index, confidence):
+    """application/x-vehicle-predictions body for the given rows"""
+    return (_HEADER.pack(PREDICTIONS_MAGIC, len(class_index), 2)
+            + np.asarray(class_index, dtype='<i2').tobytes()
+            + np.asarray(confidence, dtype='<f4').tobytes())
+
+
+def decode_predictions(body):
+    """Class indices and confidences of an application/x-vehicle-predictions body"""
+    magic, rows, _ = _HEADER.unpack_from(body)
+    if magic != PREDICTIONS_MAGIC:
+        raise ValueError(f'Bad predictions magic {magic!r}, expected {PREDICTIONS_MAGIC!r}')
+    class_index = np.frombuffer(body, dtype='<i2', count=rows, offset=_HEADER.size)
+    confidence = np.frombuffer(body, dtype='<f4', count=rows, offset=_HEADER.size + 2 * rows)
+    return class_index, confidence
+
+
+def encode_msgpack(payload):
+    return msgpack.packb(payload, use_bin_type=True)
@@ -0,0 +1,241 @@
+"""
+Load-testing and latency benchmark for the Flask API
+
+Sends synthetic vehicles from create_synthetic_data to /predict (one vehicle
+per request) and /predict/batch (--batch-size vehicles per request) at several
+concurrency levels, and reports throughput and p50/p95/p99 latency.
+
+Two modes:
+    inprocess  requests go through Flask's test client, one client per thread
+    gunicorn   a local gunicorn is started with backend/gunicorn.conf.py and
+               requests go over HTTP
+
+Results are saved as JSON. Pass --compare with an earlier results file to flag
+regressions; the exit status is 1 when any metric is worse than --tolerance.
+
+Usage:
+    python benchmarks/bench_api.py --mode inprocess --concurrency 1 4 16
+    python benchmarks/bench_api.py --mode gunicorn --workers 4 --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'model'))
+
+from create_model import create_synthetic_data  # noqa: E402
+
+FIELDS = ['length', 'height', 'width', 'weight', 'engine_power', 'top_speed', 'axle_count', 'seats']
+FUEL_TYPES = ['diesel', 'electric', 'hybrid', 'petrol']
+
+# Metrics compared against a baseline, and whether higher is better
+COMPARED_METRICS = {'throughput_rps': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False}
+
+
+def make_payloads(n_vehicles, seed):
+    """Synthetic vehicles as /predict JSON bodies, in random order"""
+    X, _ = create_synthetic_data(n_vehicles, seed=seed)
+    X = X[np.random.default_rng(seed).permutation(len(X))]
+    vehicles = []
+    for row in X:
+        vehicle = {field: float(value) for field, value in zip(FIELDS, row[:8])}
+        vehicle['axle_count'] = int(vehicle['axle_count'])
+        vehicle['seats'] = int(vehicle['seats'])
+        vehicle['fuel_type'] = FUEL_TYPES[int(np.argmax(row[8:12]))]
+        vehicles.append(vehicle)
+    return vehicles
+
+
+class InProcessTarget:
+    """Sends requests through Flask's test client"""
+
+    def __init__(self):
+        sys.path.insert(0, BACKEND_DIR)
+        import app
+        self.app = app.app
+        self.engine = type(app.model).__name__
+        self._local = threading.local()
+
+    def post(self, path, body):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.post(path, data=body, content_type='application/json')
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class GunicornTarget:
+    """Starts gunicorn on a free local port and sends requests over HTTP"""
+
+    def __init__(self, workers, startup_timeout=60):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        env = dict(os.environ, PORT=str(self.port), WEB_CONCURRENCY=str(workers), LOG_LEVEL='WARNING')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                with urllib.request.urlopen(self.base_url + '/model-info', timeout=2) as response:
+                    self.engine = json.load(response)['model_type']
+                break
+            except (urllib.error.URLError, ConnectionError):
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise RuntimeError('gunicorn did not become ready')
+                time.sleep(0.2)
+
+    def post(self, path, body):
+        request = urllib.request.Request(self.base_url + path, data=body,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+
+def run_level(target, path, bodies, rows_per_request, concurrency, n_requests):
+    """Send n_requests bodies with the given concurrency and summarize latencies"""
+    latencies = np.empty(n_requests)
+    statuses = np.empty(n_requests, dtype=int)
+
+    def send(i):
+        start = time.perf_counter()
+        statuses[i] = target.post(path, bodies[i % len(bodies)])
+        latencies[i] = time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(n_requests)))
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        'concurrency': concurrency,
+        'requests': n_requests,
+        'errors': int((statuses != 200).sum()),
+        'throughput_rps': n_requests / elapsed,
+        'rows_per_second': n_requests * rows_per_request / elapsed,
+        'mean_ms': float(latencies.mean() * 1000),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return human-readable regressions of results against baseline"""
+    for key in ('mode', 'workers', 'batch_size', 'model_type'):
+        if baseline.get(key) != results.get(key):
+            print(f"Warning: baseline {key} is {baseline.get(key)!r}, this run used {results.get(key)!r}")
+    previous = {(r['scenario'], r['concurrency']): r for r in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        before = previous.get((result['scenario'], result['concurrency']))
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            change = (result[metric] - before[metric]) / before[metric]
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{result['scenario']} c={result['concurrency']} {metric}: "
+                                   f"{before[metric]:.2f} -> {result[metric]:.2f} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['inprocess', 'gunicorn'], default='inprocess')
+    parser.add_argument('--workers', type=int, default=1, help="gunicorn workers (gunicorn mode)")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=500, help="Requests per scenario and concurrency level")
+    parser.add_argument('--batch-size', type=int, default=100, help="Vehicles per /predict/batch request")
+    parser.add_argument('--vehicles', type=int, default=5000, help="Distinct synthetic vehicles to draw from")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--with-cache', action='store_true', help="Leave the prediction cache enabled")
+    parser.add_argument('--output', default='bench_results.json', help="Where to save the results")
+    parser.add_argument('--compare', help="Earlier results file to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed relative slowdown")
+    args = parser.parse_args()
+
+    if not args.with_cache:
+        os.environ['PREDICTION_CACHE_SIZE'] = '0'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    vehicles = make_payloads(args.vehicles, args.seed)
+    scenarios = {
+        'predict': ('/predict', [json.dumps(v).encode() for v in vehicles], 1),
+        'batch': ('/predict/batch', [
+            json.dumps(vehicles[i:i + args.batch_size]).encode()
+            for i in range(0, len(vehicles) - args.batch_size + 1, args.batch_size)
+        ], args.batch_size),
+    }
+
+    target = InProcessTarget() if args.mode == 'inprocess' else GunicornTarget(args.workers)
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'mode': args.mode,
+        'workers': args.workers if args.mode == 'gunicorn' else None,
+        'model_type': target.engine,
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'batch_size': args.batch_size,
+        'results': [],
+    }
+    try:
+        print(f"{'scenario':<9} {'conc':>5} {'req/s':>9} {'rows/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for name, (path, bodies, rows_per_request) in scenarios.items():
+            target.post(path, bodies[0])  # warm up
+            for concurrency in args.concurrency:
+                level = run_level(target, path, bodies, rows_per_request, concurrency, args.requests)
+                level['scenario'] = name
+                results['results'].append(level)
+                print(f"{name:<9} {concurrency:>5} {level['throughput_rps']:>9.1f} {level['rows_per_second']:>10.1f} "
+                      f"{level['p50_ms']:>8.2f} {level['p95_ms']:>8.2f} {level['p99_ms']:>8.2f} {level['errors']:>7}")
+    finally:
+        target.close()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Cold-start benchmark for the backend
+
+Starts a fresh Python process per run, imports the app and answers one
+/predict through Flask's test client, timing:
+    import    - `import app`, including load_model()
+    first     - the first /predict after import
+    total     - process start to first response (interpreter startup included)
+
+Each engine that has an artifact on disk is measured, so the compiled,
+compact and cascade .npz artifacts can be compared with the sklearn pickle.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+CHILD_SCRIPT = '''
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().post('/predict', json={
+    "length": 4.88, "height": 1.45, "width": 1.84, "weight": 1590,
+    "engine_power": 203, "top_speed": 210, "axle_count": 2, "seats": 5,
+    "fuel_type": "petrol"})
+assert response.status_code == 200, response.get_json()
+answered = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "first": answered - imported,
+    "model_type": type(app.model).__name__,
+}))
+'''
+
+
+def run_once(engine):
+    env = dict(os.environ, MODEL_ENGINE=engine, LOG_LEVEL='WARNING')
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-W', 'ignore', '-c', CHILD_SCRIPT],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    total = time.perf_counter() - start
+    result = json.loads(output.strip().splitlines()[-1])
+    result['total'] = total
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="Fresh processes per engine")
+    args = parser.parse_args()
+
+    model_dir = os.path.join(BACKEND_DIR, '..', 'model')
+    engines = []
+    if os.path.exists(os.path.join(model_dir, 'vehicle_model.pkl')):
+        engines.append('sklearn')
+    if os.path.exists(os.path.join(model_dir, 'vehicle_model_forest.npz')):
+        engines.append('compiled')
+    else:
+        print("No compiled forest found; run 'python create_model.py export' in model/ to compare")
+    if os.path.exists(os.path.join(model_dir, 'vehicle_model_compact.npz')):
+        engines.append('compact')
+    if os.path.exists(os.path.join(model_dir, 'vehicle_model_cascade.npz')):
+        engines.append('cascade')
+
+    print(f"{'engine':<10} {'model':<22} {'import ms':>10} {'first ms':>10} {'total ms':>10}")
+    for engine in engines:
+        runs = [run_once(engine) for _ in range(args.runs)]
+        medians = {key: statistics.median(run[key] for run in runs) * 1000 for key in ('import', 'first', 'total')}
+        print(f"{engine:<10} {runs[0]['model_type']:<22} {medians['import']:>10.1f} "
+              f"{medians['first']:>10.1f} {medians['total']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,7 @@ pip install -r requirements.txt
 echo "Creating ML model..."
 cd model
 python create_model.py
+python create_model.py compress
 cd ..
 
 echo "Installing frontend dependencies..."
@@ -6,164 +6,252 @@ The model will be saved as a .pkl file and can be loaded by the Flask backend.
 """
 
 import numpy as np
-import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import StratifiedKFold, train_test_split
 from sklearn.metrics import classification_report, accuracy_score
 import joblib
+import argparse
+import hashlib
+import itertools
+import json
+import math
 import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 
-def create_synthetic_data(n_samples=2000):
-    """Create synthetic vehicle data for training"""
-    np.random.seed(42)
-    
-    data = []
-    labels = []
-    
-    # Define detailed vehicle type parameters
-    vehicle_types = {
-        # Two-Wheeler Categories
-        'Scooter': {
-            'length': (1.6, 1.9), 'height': (1.1, 1.2), 'width': (0.65, 0.72),
-            'weight': (100, 130), 'power': (6, 15), 'speed': (60, 90),
-            'axles': (2, 2), 'seats': (2, 2), 'fuel_probs': [0.05, 0.0, 0.85, 0.1]
-        },
-        'Standard_Motorcycle': {
-            'length': (2.0, 2.2), 'height': (1.0, 1.15), 'width': (0.75, 0.85),
-            'weight': (140, 220), 'power': (15, 50), 'speed': (100, 140),
-            'axles': (2, 2), 'seats': (2, 2), 'fuel_probs': [0.1, 0.0, 0.8, 0.1]
-        },
-        'Sports_Bike': {
-            'length': (1.9, 2.1), 'height': (1.1, 1.2), 'width': (0.65, 0.75),
-            'weight': (160, 220), 'power': (100, 220), 'speed': (250, 320),
-            'axles': (2, 2), 'seats': (1, 2), 'fuel_probs': [0.05, 0.0, 0.9, 0.05]
-        },
-        'Cruiser_Bike': {
-            'length': (2.2, 2.5), 'height': (1.0, 1.2), 'width': (0.85, 1.0),
-            'weight': (250, 350), 'power': (60, 120), 'speed': (150, 190),
-            'axles': (2, 2), 'seats': (2, 2), 'fuel_probs': [0.1, 0.0, 0.85, 0.05]
-        },
-        
-        # Car Categories
-        'Hatchback': {
-            'length': (3.5, 4.2), 'height': (1.4, 1.6), 'width': (1.65, 1.8),
-            'weight': (800, 1200), 'power': (70, 120), 'speed': (150, 190),
-            'axles': (2, 2), 'seats': (4, 5), 'fuel_probs': [0.2, 0.15, 0.5, 0.15]
-        },
-        'Sedan': {
-            'length': (4.3, 5.1), 'height': (1.35, 1.5), 'width': (1.75, 1.9),
-            'weight': (1200, 1800), 'power': (120, 250), 'speed': (180, 230),
-            'axles': (2, 2), 'seats': (4, 5), 'fuel_probs': [0.3, 0.1, 0.45, 0.15]
-        },
-        'Luxury_Sedan': {
-            'length': (4.8, 5.5), 'height': (1.4, 1.55), 'width': (1.85, 2.0),
-            'weight': (1600, 2200), 'power': (200, 400), 'speed': (220, 280),
-            'axles': (2, 2), 'seats': (4, 5), 'fuel_probs': [0.4, 0.05, 0.35, 0.2]
-        },
-        'Wagon': {
-            'length': (4.4, 5.0), 'height': (1.5, 1.7), 'width': (1.8, 1.95),
-            'weight': (1300, 1900), 'power': (130, 220), 'speed': (170, 210),
-            'axles': (2, 2), 'seats': (5, 7), 'fuel_probs': [0.35, 0.1, 0.4, 0.15]
-        },
-        
-        # SUV Categories
-        'Compact_SUV': {
-            'length': (4.0, 4.5), 'height': (1.6, 1.75), 'width': (1.75, 1.9),
-            'weight': (1300, 1700), 'power': (100, 160), 'speed': (160, 190),
-            'axles': (2, 2), 'seats': (5, 5), 'fuel_probs': [0.3, 0.15, 0.4, 0.15]
-        },
-        'Mid_Size_SUV': {
-            'length': (4.5, 5.2), 'height': (1.7, 1.9), 'width': (1.85, 2.0),
-            'weight': (1800, 2500), 'power': (150, 300), 'speed': (170, 200),
-            'axles': (2, 2), 'seats': (5, 7), 'fuel_probs': [0.4, 0.1, 0.35, 0.15]
-        },
-        'Full_Size_SUV': {
-            'length': (5.0, 5.8), 'height': (1.8, 2.1), 'width': (1.95, 2.2),
-            'weight': (2300, 3200), 'power': (250, 450), 'speed': (180, 220),
-            'axles': (2, 2), 'seats': (6, 8), 'fuel_probs': [0.5, 0.05, 0.3, 0.15]
-        },
-        
-        # Commercial Vehicles
-        'Pickup_Truck': {
-            'length': (5.0, 6.2), 'height': (1.8, 2.0), 'width': (1.9, 2.1),
-            'weight': (1800, 2800), 'power': (200, 350), 'speed': (150, 180),
-            'axles': (2, 2), 'seats': (2, 5), 'fuel_probs': [0.3, 0.05, 0.6, 0.05]
-        },
-        'Light_Truck': {
-            'length': (5.5, 7.5), 'height': (2.2, 2.8), 'width': (1.9, 2.3),
-            'weight': (3000, 8000), 'power': (150, 300), 'speed': (90, 130),
-            'axles': (2, 3), 'seats': (2, 3), 'fuel_probs': [0.7, 0.1, 0.15, 0.05]
-        },
-        'Heavy_Truck': {
-            'length': (7.0, 20.0), 'height': (3.0, 4.2), 'width': (2.3, 2.8),
-            'weight': (8000, 45000), 'power': (300, 700), 'speed': (80, 120),
-            'axles': (3, 8), 'seats': (1, 3), 'fuel_probs': [0.85, 0.05, 0.08, 0.02]
-        },
-        
-        # Bus Categories
-        'Mini_Bus': {
-            'length': (6.0, 8.0), 'height': (2.3, 2.8), 'width': (2.0, 2.3),
-            'weight': (3500, 6000), 'power': (120, 200), 'speed': (120, 140),
-            'axles': (2, 2), 'seats': (12, 25), 'fuel_probs': [0.5, 0.2, 0.2, 0.1]
-        },
-        'City_Bus': {
-            'length': (9.0, 12.0), 'height': (2.8, 3.2), 'width': (2.4, 2.6),
-            'weight': (8000, 15000), 'power': (200, 350), 'speed': (80, 100),
-            'axles': (2, 3), 'seats': (25, 50), 'fuel_probs': [0.7, 0.15, 0.1, 0.05]
-        },
-        'Coach_Bus': {
-            'length': (11.0, 15.0), 'height': (3.2, 4.0), 'width': (2.5, 2.8),
-            'weight': (15000, 25000), 'power': (350, 500), 'speed': (90, 120),
-            'axles': (3, 4), 'seats': (40, 80), 'fuel_probs': [0.8, 0.1, 0.08, 0.02]
-        }
+from feature_encoder import FEATURE_COLUMNS, FeatureEncoder
+from feature_stats import save_statistics, training_statistics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MODEL_PATH = 'vehicle_model.pkl'
+COMPILED_MODEL_PATH = 'vehicle_model_forest.npz'
+COMPACT_MODEL_PATH = 'vehicle_model_compact.npz'
+CASCADE_MODEL_PATH = 'vehicle_model_cascade.npz'
+INDEX_MODEL_PATH = 'vehicle_model_index.npz'
+# Training distribution the backend's drift monitor compares production inputs with
+TRAINING_STATS_PATH = 'vehicle_model_stats.json'
+# Generated data and fold assignments reused by `create_model.py select`
+SELECTION_CACHE_DIR = 'selection_cache'
+# Bump together with FORMAT_VERSION in backend/compiled_forest.py
+COMPILED_FORMAT_VERSION = 2
+
+# Hyperparameters of the served forest
+FOREST_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 15,
+    'min_samples_split': 5,
+    'min_samples_leaf': 2,
+    'random_state': 42,
+}
+
+# Values tried by `create_model.py select`; other parameters come from FOREST_PARAMS
+SEARCH_GRID = {
+    'n_estimators': [25, 50, 100],
+    'max_depth': [8, 12, 15],
+    'min_samples_leaf': [1, 2, 4],
+}
+
+# Detailed vehicle type parameters: uniform ranges for the continuous
+# features, inclusive integer ranges for axles/seats and the probabilities of
+# each fuel type, in feature_encoder.FUEL_TYPES order (diesel, electric,
+# hybrid, petrol)
+VEHICLE_TYPES = {
+    # Two-Wheeler Categories
+    'Scooter': {
+        'length': (1.6, 1.9), 'height': (1.1, 1.2), 'width': (0.65, 0.72),
+        'weight': (100, 130), 'power': (6, 15), 'speed': (60, 90),
+        'axles': (2, 2), 'seats': (2, 2), 'fuel_probs': [0.05, 0.0, 0.85, 0.1]
+    },
+    'Standard_Motorcycle': {
+        'length': (2.0, 2.2), 'height': (1.0, 1.15), 'width': (0.75, 0.85),
+        'weight': (140, 220), 'power': (15, 50), 'speed': (100, 140),
+        'axles': (2, 2), 'seats': (2, 2), 'fuel_probs': [0.1, 0.0, 0.8, 0.1]
+    },
+    'Sports_Bike': {
+        'length': (1.9, 2.1), 'height': (1.1, 1.2), 'width': (0.65, 0.75),
+        'weight': (160, 220), 'power': (100, 220), 'speed': (250, 320),
+        'axles': (2, 2), 'seats': (1, 2), 'fuel_probs': [0.05, 0.0, 0.9, 0.05]
+    },
+    'Cruiser_Bike': {
+        'length': (2.2, 2.5), 'height': (1.0, 1.2), 'width': (0.85, 1.0),
+        'weight': (250, 350), 'power': (60, 120), 'speed': (150, 190),
+        'axles': (2, 2), 'seats': (2, 2), 'fuel_probs': [0.1, 0.0, 0.85, 0.05]
+    },
+    
+    # Car Categories
+    'Hatchback': {
+        'length': (3.5, 4.2), 'height': (1.4, 1.6), 'width': (1.65, 1.8),
+        'weight': (800, 1200), 'power': (70, 120), 'speed': (150, 190),
+        'axles': (2, 2), 'seats': (4, 5), 'fuel_probs': [0.2, 0.15, 0.5, 0.15]
+    },
+    'Sedan': {
+        'length': (4.3, 5.1), 'height': (1.35, 1.5), 'width': (1.75, 1.9),
+        'weight': (1200, 1800), 'power': (120, 250), 'speed': (180, 230),
+        'axles': (2, 2), 'seats': (4, 5), 'fuel_probs': [0.3, 0.1, 0.45, 0.15]
+    },
+    'Luxury_Sedan': {
+        'length': (4.8, 5.5), 'height': (1.4, 1.55), 'width': (1.85, 2.0),
+        'weight': (1600, 2200), 'power': (200, 400), 'speed': (220, 280),
+        'axles': (2, 2), 'seats': (4, 5), 'fuel_probs': [0.4, 0.05, 0.35, 0.2]
+    },
+    'Wagon': {
+        'length': (4.4, 5.0), 'height': (1.5, 1.7), 'width': (1.8, 1.95),
+        'weight': (1300, 1900), 'power': (130, 220), 'speed': (170, 210),
+        'axles': (2, 2), 'seats': (5, 7), 'fuel_probs': [0.35, 0.1, 0.4, 0.15]
+    },
+    
+    # SUV Categories
+    'Compact_SUV': {
+        'length': (4.0, 4.5), 'height': (1.6, 1.75), 'width': (1.75, 1.9),
+        'weight': (1300, 1700), 'power': (100, 160), 'speed': (160, 190),
+        'axles': (2, 2), 'seats': (5, 5), 'fuel_probs': [0.3, 0.15, 0.4, 0.15]
+    },
+    'Mid_Size_SUV': {
+        'length': (4.5, 5.2), 'height': (1.7, 1.9), 'width': (1.85, 2.0),
+        'weight': (1800, 2500), 'power': (150, 300), 'speed': (170, 200),
+        'axles': (2, 2), 'seats': (5, 7), 'fuel_probs': [0.4, 0.1, 0.35, 0.15]
+    },
+    'Full_Size_SUV': {
+        'length': (5.0, 5.8), 'height': (1.8, 2.1), 'width': (1.95, 2.2),
+        'weight': (2300, 3200), 'power': (250, 450), 'speed': (180, 220),
+        'axles': (2, 2), 'seats': (6, 8), 'fuel_probs': [0.5, 0.05, 0.3, 0.15]
+    },
+    
+    # Commercial Vehicles
+    'Pickup_Truck': {
+        'length': (5.0, 6.2), 'height': (1.8, 2.0), 'width': (1.9, 2.1),
+        'weight': (1800, 2800), 'power': (200, 350), 'speed': (150, 180),
+        'axles': (2, 2), 'seats': (2, 5), 'fuel_probs': [0.3, 0.05, 0.6, 0.05]
+    },
+    'Light_Truck': {
+        'length': (5.5, 7.5), 'height': (2.2, 2.8), 'width': (1.9, 2.3),
+        'weight': (3000, 8000), 'power': (150, 300), 'speed': (90, 130),
+        'axles': (2, 3), 'seats': (2, 3), 'fuel_probs': [0.7, 0.1, 0.15, 0.05]
+    },
+    'Heavy_Truck': {
+        'length': (7.0, 20.0), 'height': (3.0, 4.2), 'width': (2.3, 2.8),
+        'weight': (8000, 45000), 'power': (300, 700), 'speed': (80, 120),
+        'axles': (3, 8), 'seats': (1, 3), 'fuel_probs': [0.85, 0.05, 0.08, 0.02]
+    },
+    
+    # Bus Categories
+    'Mini_Bus': {
+        'length': (6.0, 8.0), 'height': (2.3, 2.8), 'width': (2.0, 2.3),
+        'weight': (3500, 6000), 'power': (120, 200), 'speed': (120, 140),
+        'axles': (2, 2), 'seats': (12, 25), 'fuel_probs': [0.5, 0.2, 0.2, 0.1]
+    },
+    'City_Bus': {
+        'length': (9.0, 12.0), 'height': (2.8, 3.2), 'width': (2.4, 2.6),
+        'weight': (8000, 15000), 'power': (200, 350), 'speed': (80, 100),
+        'axles': (2, 3), 'seats': (25, 50), 'fuel_probs': [0.7, 0.15, 0.1, 0.05]
+    },
+    'Coach_Bus': {
+        'length': (11.0, 15.0), 'height': (3.2, 4.0), 'width': (2.5, 2.8),
+        'weight': (15000, 25000), 'power': (350, 500), 'speed': (90, 120),
+        'axles': (3, 4), 'seats': (40, 80), 'fuel_probs': [0.8, 0.1, 0.08, 0.02]
     }
+}
+
+# Families of VEHICLE_TYPES, separated by the cascade's coarse stage
+VEHICLE_FAMILIES = {
+    'two_wheeler': ['Scooter', 'Standard_Motorcycle', 'Sports_Bike', 'Cruiser_Bike'],
+    'car': ['Hatchback', 'Sedan', 'Luxury_Sedan', 'Wagon'],
+    'suv': ['Compact_SUV', 'Mid_Size_SUV', 'Full_Size_SUV'],
+    'commercial': ['Pickup_Truck', 'Light_Truck', 'Heavy_Truck'],
+    'bus': ['Mini_Bus', 'City_Bus', 'Coach_Bus'],
+}
+
+# Same encoder as the backend, so training and serving share one column order
+ENCODER = FeatureEncoder()
+
+def _generate_samples(rng, samples_per_type):
+    """Draw samples_per_type rows for every vehicle type as whole arrays"""
+    names = list(VEHICLE_TYPES)
+    params = [VEHICLE_TYPES[name] for name in names]
+    n_rows = samples_per_type * len(names)
     
-    # Generate samples for each vehicle type
-    samples_per_type = n_samples // len(vehicle_types)
-    
-    for vehicle_type, params in vehicle_types.items():
-        for _ in range(samples_per_type):
-            # Generate features
-            length = np.random.uniform(*params['length'])
-            height = np.random.uniform(*params['height'])
-            width = np.random.uniform(*params['width'])
-            weight = np.random.uniform(*params['weight'])
-            power = np.random.uniform(*params['power'])
-            speed = np.random.uniform(*params['speed'])
-            # Generate axles
-            if params['axles'][0] == params['axles'][1]:
-                axles = params['axles'][0]
-            else:
-                axles = np.random.randint(params['axles'][0], params['axles'][1] + 1)
-            
-            # Generate seats
-            if params['seats'][0] == params['seats'][1]:
-                seats = params['seats'][0]
-            else:
-                seats = np.random.randint(params['seats'][0], params['seats'][1] + 1)
-            
-            # Generate fuel type based on probabilities
-            fuel_choice = np.random.choice(4, p=params['fuel_probs'])
-            fuel_onehot = [0, 0, 0, 0]
-            fuel_onehot[fuel_choice] = 1
-            
-            # Combine features
-            features = [length, height, width, weight, power, speed, axles, seats] + fuel_onehot
-            
-            data.append(features)
-            labels.append(vehicle_type)
-    
-    return np.array(data), np.array(labels)
+    # Per-row bounds, one row of parameters repeated for each sample of a type
+    continuous = ['length', 'height', 'width', 'weight', 'power', 'speed']
+    low = np.repeat([[p[key][0] for key in continuous] for p in params], samples_per_type, axis=0)
+    high = np.repeat([[p[key][1] for key in continuous] for p in params], samples_per_type, axis=0)
+    int_low = np.repeat([[p['axles'][0], p['seats'][0]] for p in params], samples_per_type, axis=0)
+    int_high = np.repeat([[p['axles'][1], p['seats'][1]] for p in params], samples_per_type, axis=0)
+    fuel_cdf = np.repeat(np.cumsum([p['fuel_probs'] for p in params], axis=1), samples_per_type, axis=0)
+    
+    X = np.empty((n_rows, len(FEATURE_COLUMNS)))
+    X[:, 0:6] = rng.uniform(low, high)
+    X[:, 6:8] = rng.integers(int_low, int_high, endpoint=True)
+    
+    # Categorical fuel sampling: inverse CDF of each row's own distribution
+    fuel_choice = (rng.random(n_rows)[:, np.newaxis] >= fuel_cdf[:, :-1]).sum(axis=1)
+    X[:, ENCODER.fuel_offset:] = ENCODER.fuel_one_hot[fuel_choice]
+    
+    y = np.repeat(np.array(names), samples_per_type)
+    return X, y
+
+def create_synthetic_data(n_samples=2000, seed=42):
+    """Create synthetic vehicle data for training"""
+    rng = np.random.default_rng(seed)
+    samples_per_type = n_samples // len(VEHICLE_TYPES)
+    return _generate_samples(rng, samples_per_type)
+
+def write_synthetic_shards(output_dir, n_samples, shard_size=100000, seed=42):
+    """Generate a synthetic dataset shard by shard and write it to disk as .npy files.
+
+    Only one shard is held in memory at a time, so the dataset size is bounded
+    by disk space rather than RAM. Each shard draws from its own child of the
+    seed, so the output is deterministic for a given seed and shard size.
+    A manifest.json describing the shards is written alongside them.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    samples_per_type = max(shard_size // len(VEHICLE_TYPES), 1)
+    rows_per_shard = samples_per_type * len(VEHICLE_TYPES)
+    n_shards = max(-(-n_samples // rows_per_shard), 1)
+    
+    shards = []
+    remaining = n_samples
+    for index, child in enumerate(np.random.SeedSequence(seed).spawn(n_shards)):
+        if shards and remaining < len(VEHICLE_TYPES):
+            break
+        # The last shard only holds what is left of n_samples
+        shard_per_type = min(samples_per_type, max(remaining // len(VEHICLE_TYPES), 1))
+        X, y = _generate_samples(np.random.default_rng(child), shard_per_type)
+        remaining -= len(y)
+        X_name, y_name = f'X-{index:05d}.npy', f'y-{index:05d}.npy'
+        np.save(os.path.join(output_dir, X_name), X)
+        np.save(os.path.join(output_dir, y_name), y)
+        shards.append({'X': X_name, 'y': y_name, 'rows': len(y)})
+        print(f"Wrote shard {index + 1}/{n_shards} ({len(y)} rows)")
+    
+    manifest = {
+        'seed': seed,
+        'shard_size': rows_per_shard,
+        'n_samples': sum(shard['rows'] for shard in shards),
+        'feature_columns': FEATURE_COLUMNS,
+        'shards': shards,
+    }
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Dataset of {manifest['n_samples']} rows written to '{output_dir}'")
+    return manifest
+
+def training_split():
+    """The synthetic dataset and train/test split used by train_model"""
+    X, y = create_synthetic_data(2000)
+    return train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
 
 def train_model():
     """Train and save the vehicle classification model"""
     print("Generating synthetic vehicle data...")
-    X, y = create_synthetic_data(2000)
-    
-    # Split the data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
+    X_train, X_test, y_train, y_test = training_split()
+    y = np.concatenate([y_train, y_test])
     
     print(f"Training set size: {X_train.shape[0]}")
     print(f"Test set size: {X_test.shape[0]}")
@@ -172,15 +260,11 @@ def train_model():
     
     # Train the model
     print("Training Random Forest model...")
-    model = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=15,
-        min_samples_split=5,
-        min_samples_leaf=2,
-        random_state=42
-    )
+    model = RandomForestClassifier(n_jobs=-1, **FOREST_PARAMS)
     
     model.fit(X_train, y_train)
+    # Serve single rows without spinning up a thread pool per call
+    model.n_jobs = None
     
     # Evaluate the model
     y_pred = model.predict(X_test)
@@ -192,27 +276,816 @@ def train_model():
     
     # Save the model
     os.makedirs('.', exist_ok=True)
-    joblib.dump(model, 'vehicle_model.pkl')
-    print(f"Model saved as 'vehicle_model.pkl'")
+    write_atomically(MODEL_PATH, lambda f: joblib.dump(model, f))
+    print(f"Model saved as '{MODEL_PATH}'")
+    export_compiled_forest(model)
+    export_training_stats(X_train, y_train)
     
     return model
 
-if __name__ == "__main__":
-    model = train_model()
+def peak_memory_mb():
+    """Peak resident memory of this process in MB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    return peak / 1024 / 1024 if os.uname().sysname == 'Darwin' else peak / 1024
+
+@contextmanager
+def timed_stage(timings, name):
+    """Record the wall-clock time of a block under timings[name]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+def iter_shards(data_dir, shards=None):
+    """Yield (X, y) for each shard of a dataset written by write_synthetic_shards.
+
+    Feature matrices are memory-mapped, so a shard is only read from disk as
+    the caller touches it.
+    """
+    with open(os.path.join(data_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest['feature_columns'] != FEATURE_COLUMNS:
+        raise ValueError(f"Dataset columns {manifest['feature_columns']} do not match {FEATURE_COLUMNS}")
+    for shard in (manifest['shards'] if shards is None else shards):
+        X = np.load(os.path.join(data_dir, shard['X']), mmap_mode='r')
+        y = np.load(os.path.join(data_dir, shard['y']))
+        yield X, y
+
+def train_from_shards(data_dir, output=MODEL_PATH, warm_start=False, trees_per_shard=10,
+                      n_jobs=-1, eval_shards=1):
+    """Train the served forest from a sharded dataset on all cores.
+
+    The last eval_shards shards are held out for evaluation. By default the
+    training shards are concatenated and fitted in one go; with warm_start the
+    forest grows by trees_per_shard trees fitted on each shard in turn, so only
+    one shard has to be in memory at a time. Writes the same vehicle_model.pkl
+    (and compiled forest) as train_model().
+    """
+    timings = {}
+    wall_start = time.perf_counter()
+    
+    with open(os.path.join(data_dir, 'manifest.json')) as f:
+        shards = json.load(f)['shards']
+    if len(shards) <= eval_shards:
+        raise ValueError(f"Need more than {eval_shards} shard(s) to hold some out for evaluation")
+    train_shards, test_shards = shards[:-eval_shards], shards[-eval_shards:]
+    print(f"Training on {len(train_shards)} shard(s), evaluating on {len(test_shards)}")
+    
+    params = dict(FOREST_PARAMS, n_jobs=n_jobs)
+    if warm_start:
+        params.update(n_estimators=0, warm_start=True)
+        model = RandomForestClassifier(**params)
+        classes = None
+        for index, (X, y) in enumerate(iter_shards(data_dir, train_shards)):
+            with timed_stage(timings, 'load'):
+                X = np.ascontiguousarray(X)
+            # Every warm-start fit must see the same label set
+            shard_classes = np.unique(y)
+            if classes is None:
+                classes = shard_classes
+            elif not np.array_equal(classes, shard_classes):
+                raise ValueError(f"Shard {index} does not contain every class; cannot warm-start on it")
+            with timed_stage(timings, 'fit'):
+                model.n_estimators += trees_per_shard
+                model.fit(X, y)
+            print(f"Shard {index + 1}/{len(train_shards)}: {len(y)} rows, {model.n_estimators} trees")
+        model.warm_start = False
+    else:
+        with timed_stage(timings, 'load'):
+            parts = list(iter_shards(data_dir, train_shards))
+            X = np.concatenate([X for X, _ in parts])
+            y = np.concatenate([y for _, y in parts])
+            del parts
+        print(f"Training set size: {len(y)}")
+        model = RandomForestClassifier(**params)
+        with timed_stage(timings, 'fit'):
+            model.fit(X, y)
+        del X, y
+    
+    # Evaluate shard by shard so the held-out set never has to fit in memory
+    correct = total = 0
+    with timed_stage(timings, 'evaluate'):
+        for X, y in iter_shards(data_dir, test_shards):
+            correct += int((model.predict(X) == y).sum())
+            total += len(y)
+    print(f"Model Accuracy: {correct / total:.3f} on {total} held-out rows")
+    
+    with timed_stage(timings, 'save'):
+        model.n_jobs = None
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        write_atomically(output, lambda f: joblib.dump(model, f))
+        export_compiled_forest(model, os.path.join(os.path.dirname(output), COMPILED_MODEL_PATH))
+        # One shard is a large enough sample of the training distribution
+        X, y = next(iter_shards(data_dir, train_shards[:1]))
+        export_training_stats(X, y, os.path.join(os.path.dirname(output), TRAINING_STATS_PATH))
+    print(f"Model saved as '{output}'")
+    
+    print("\nStage timings:")
+    for name, seconds in timings.items():
+        print(f"  {name:<10} {seconds:8.2f} s")
+    print(f"  {'total':<10} {time.perf_counter() - wall_start:8.2f} s")
+    peak = peak_memory_mb()
+    if peak is not None:
+        print(f"Peak memory: {peak:.0f} MB")
+    
+    return model
+
+def _node_depths(tree):
+    """Depth of every node of a fitted sklearn tree (the root is at depth 0)"""
+    depth = np.zeros(tree.node_count, dtype=np.int64)
+    # Nodes are stored depth-first, so a parent always comes before its children
+    for node in range(tree.node_count):
+        if tree.children_left[node] != -1:
+            depth[tree.children_left[node]] = depth[tree.children_right[node]] = depth[node] + 1
+    return depth
+
+def compile_forest(model, max_depth=None, trees=None):
+    """Flatten a fitted RandomForestClassifier into contiguous node arrays.
+
+    All trees are concatenated into one set of arrays indexed by global node id.
+    Leaves point to themselves and carry a normalized class distribution, so an
+    evaluator can walk every tree for a whole batch in lockstep.
+    
+    ``max_depth`` cuts every tree at that depth; the nodes there become leaves
+    carrying the class distribution of their training samples. ``trees``
+    selects a subset of the estimators by index.
+    """
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    depth_reached = 0
+    estimators = model.estimators_ if trees is None else [model.estimators_[i] for i in trees]
+    
+    for estimator in estimators:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+        depth = _node_depths(tree)
+        keep = np.ones(tree.node_count, dtype=bool)
+        if max_depth is not None:
+            keep = depth <= max_depth
+            is_leaf |= depth == max_depth
+        # Kept nodes stay in depth-first order under their new ids
+        new_id = np.cumsum(keep) - 1
+        node_ids = np.arange(keep.sum())
+        is_leaf = is_leaf[keep]
+        
+        # Older sklearn stores class counts and normalizes them in
+        # DecisionTreeClassifier.predict_proba, newer releases store the
+        # fractions directly; only normalize rows that are still counts
+        value = tree.value[keep, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[np.isclose(normalizer, 1.0) | (normalizer == 0.0)] = 1.0
+        
+        features.append(np.where(is_leaf, 0, tree.feature[keep]))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold[keep]))
+        lefts.append(np.where(is_leaf, node_ids, new_id[tree.children_left[keep]]) + offset)
+        rights.append(np.where(is_leaf, node_ids, new_id[tree.children_right[keep]]) + offset)
+        values.append(value / normalizer)
+        roots.append(offset)
+        
+        offset += len(node_ids)
+        depth_reached = max(depth_reached, int(depth[keep].max()))
+    
+    return {
+        'feature': np.concatenate(features).astype(np.int32),
+        'threshold': np.concatenate(thresholds).astype(np.float64),
+        'left': np.concatenate(lefts).astype(np.int32),
+        'right': np.concatenate(rights).astype(np.int32),
+        'value': np.concatenate(values),
+        'roots': np.array(roots, dtype=np.int32),
+        'max_depth': depth_reached,
+        'classes': np.asarray(model.classes_),
+        'n_features': model.n_features_in_,
+        'feature_columns': np.array(FEATURE_COLUMNS),
+    }
+
+def quantize_forest(arrays):
+    """Reduced-precision copy of compile_forest's arrays for the compact variant.
+
+    Thresholds become float32, rounded down so a float32 input takes the same
+    branch as it does against the float64 original. Class distributions become
+    uint8 counts out of 255 that still sum to exactly 255. Feature ids and node
+    indices use the smallest integer types that hold them.
+    """
+    threshold = arrays['threshold'].astype(np.float32)
+    rounded_up = threshold > arrays['threshold']
+    threshold[rounded_up] = np.nextafter(threshold[rounded_up], np.float32(-np.inf))
+    
+    # Largest remainder rounding: the units lost by flooring go to the classes
+    # with the biggest fractional parts
+    scaled = arrays['value'] * 255
+    value = np.floor(scaled)
+    shortfall = np.rint(255 - value.sum(axis=1)).astype(np.int64)
+    rank = np.argsort(np.argsort(value - scaled, axis=1, kind='stable'), axis=1, kind='stable')
+    value += rank < shortfall[:, np.newaxis]
+    
+    index_dtype = np.uint16 if len(arrays['feature']) <= np.iinfo(np.uint16).max else np.int32
+    return dict(
+        arrays,
+        feature=arrays['feature'].astype(np.uint8),
+        threshold=threshold,
+        left=arrays['left'].astype(index_dtype),
+        right=arrays['right'].astype(index_dtype),
+        roots=arrays['roots'].astype(index_dtype),
+        value=value.astype(np.uint8),
+        value_scale=1 / 255,
+    )
+
+def _backend_module(name):
+    """A module of the backend, so artifacts are measured the way they are served"""
+    import importlib
+    import sys
+    backend_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+    if backend_dir not in sys.path:
+        sys.path.insert(0, backend_dir)
+    return importlib.import_module(name)
+
+def _compiled_forest_class():
+    """The backend's evaluator"""
+    return _backend_module('compiled_forest').CompiledForest
+
+def select_trees(tree_proba, y, target, tolerance=0.01, min_trees=1):
+    """Backward elimination of trees that don't help accuracy.
+
+    ``tree_proba`` holds every tree's class distributions, shape (n_trees,
+    n_samples, n_classes), and ``y`` the true class indices. The tree whose
+    removal costs least is dropped until the next removal would take accuracy
+    below ``target - tolerance`` or only ``min_trees`` are left. Returns the
+    indices of the kept trees.
+    """
+    keep = list(range(len(tree_proba)))
+    total = tree_proba.sum(axis=0)
+    while len(keep) > min_trees:
+        without = total - tree_proba[keep]
+        accuracy = (without.argmax(axis=2) == y).mean(axis=1)
+        best = int(accuracy.argmax())
+        if accuracy[best] < target - tolerance:
+            break
+        total = without[best]
+        keep.pop(best)
+    return keep
+
+def compress_model(model, X_select, y_select, max_depth=10, tolerance=0.01, min_trees=10):
+    """Depth-capped, pruned and quantized arrays of a fitted forest.
+
+    Trees are pruned against (X_select, y_select) while accuracy stays within
+    ``tolerance`` of the full model's.
+    """
+    CompiledForest = _compiled_forest_class()
+    target = accuracy_score(y_select, model.predict(X_select))
+    
+    capped = CompiledForest(compile_forest(model, max_depth=max_depth))
+    tree_proba = capped.value[capped.apply(X_select).T]
+    keep = select_trees(tree_proba, np.searchsorted(model.classes_, y_select), target, tolerance, min_trees)
+    
+    arrays = quantize_forest(compile_forest(model, max_depth=max_depth, trees=keep))
+    print(f"Kept {len(keep)} of {len(model.estimators_)} trees at depth <= {arrays['max_depth']} "
+          f"({len(arrays['feature'])} nodes)")
+    return arrays
+
+def write_atomically(path, write):
+    """Call write(f) on a temporary file, then move it over path.
+
+    The backend loads artifacts at startup, its watcher reloads them and
+    MODEL_MMAP workers map them, so none of them may see a partial file.
+    """
+    with open(path + '.tmp', 'wb') as f:
+        write(f)
+    os.replace(path + '.tmp', path)
+
+def export_compiled_forest(model, path=COMPILED_MODEL_PATH, X_check=None):
+    """Save the flattened forest next to the pickled model as an uncompressed .npz.
+
+    The backend serves this file in place of the pickle, so it is only written
+    if its probabilities equal ``model.predict_proba`` exactly on ``X_check``
+    (by default train_model's test split).
+    """
+    arrays = compile_forest(model)
+    if X_check is None:
+        _, X_check, _, _ = training_split()
+    expected = model.predict_proba(X_check)
+    actual = _compiled_forest_class()(arrays).predict_proba(X_check)
+    if not np.array_equal(actual, expected):
+        raise ValueError(f"Compiled forest does not reproduce predict_proba exactly "
+                         f"(max difference {np.abs(actual - expected).max():.3g}); not saving '{path}'")
+    # Uncompressed so the backend can memory-map the arrays
+    write_atomically(path, lambda f: np.savez(f, format_version=COMPILED_FORMAT_VERSION, **arrays))
+    print(f"Compiled forest saved as '{path}' "
+          f"({len(arrays['roots'])} trees, {len(arrays['feature'])} nodes, depth {arrays['max_depth']})")
+    return arrays
+
+def export_training_stats(X, y, path=TRAINING_STATS_PATH):
+    """Save the training distribution of every feature for drift monitoring"""
+    save_statistics(training_statistics(X, y), path)
+    print(f"Training statistics saved as '{path}' ({len(y)} rows)")
+
+def export_compact_model(model, X_select, y_select, path=COMPACT_MODEL_PATH, **options):
+    """Compress the forest and save it as an uncompressed .npz the backend can serve"""
+    arrays = compress_model(model, X_select, y_select, **options)
+    write_atomically(path, lambda f: np.savez(f, format_version=COMPILED_FORMAT_VERSION, **arrays))
+    print(f"Compact forest saved as '{path}'")
+    return arrays
+
+def _measure_artifact(CompiledForest, path, X, y, runs=5, single_rows=200):
+    """Size, load time, single-row latency and predictions of a compiled artifact"""
+    load_times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        forest = CompiledForest.load(path)
+        load_times.append(time.perf_counter() - started)
+    
+    latencies = []
+    for row in X[:single_rows]:
+        started = time.perf_counter()
+        forest.predict_proba(row[np.newaxis])
+        latencies.append(time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    predictions = forest.predict(X)
+    batch_seconds = time.perf_counter() - started
+    return {
+        'size_kb': os.path.getsize(path) / 1024,
+        'load_ms': np.median(load_times) * 1000,
+        'latency_us': np.median(latencies) * 1e6,
+        'batch_us': batch_seconds / len(X) * 1e6,
+        'accuracy': accuracy_score(y, predictions),
+        'predictions': predictions,
+    }
+
+def report_compression(full_path, compact_path, X, y):
+    """Compare the compact forest with the full one on held-out data"""
+    CompiledForest = _compiled_forest_class()
+    full = _measure_artifact(CompiledForest, full_path, X, y)
+    compact = _measure_artifact(CompiledForest, compact_path, X, y)
+    
+    print(f"\nCompression report ({len(y)} held-out vehicles):")
+    print(f"{'':<14} {'full':>10} {'compact':>10} {'change':>10}")
+    for key, label, unit in [('size_kb', 'Size', 'KB'), ('load_ms', 'Load', 'ms'),
+                             ('latency_us', 'Latency', 'us')]:
+        change = compact[key] / full[key] - 1
+        print(f"{label + ' (' + unit + ')':<14} {full[key]:>10.1f} {compact[key]:>10.1f} {change:>+10.1%}")
+    print(f"{'Accuracy':<14} {full['accuracy']:>10.3f} {compact['accuracy']:>10.3f} "
+          f"{compact['accuracy'] - full['accuracy']:>+10.3f}")
+    agreement = np.mean(full['predictions'] == compact['predictions'])
+    print(f"Compact model agrees with the full model on {agreement:.1%} of vehicles")
+
+def train_cascade(X_train, y_train, coarse_depth=8, family_trees=20, family_depth=8):
+    """Fit the cascade's coarse family tree and one small forest per family"""
+    family_of = {name: family for family, names in VEHICLE_FAMILIES.items() for name in names}
+    families = np.array([family_of[name] for name in y_train])
+    
+    # A single unbootstrapped tree over all features, so it compiles like a forest
+    coarse = RandomForestClassifier(n_estimators=1, max_depth=coarse_depth, bootstrap=False,
+                                    max_features=None, random_state=42)
+    coarse.fit(X_train, families)
+    
+    family_models = []
+    for family in coarse.classes_:
+        rows = families == family
+        forest = RandomForestClassifier(**dict(FOREST_PARAMS, n_estimators=family_trees, max_depth=family_depth))
+        forest.fit(X_train[rows], y_train[rows])
+        family_models.append(forest)
+        print(f"Family {family}: {rows.sum()} training rows, {len(forest.classes_)} subtypes")
+    return coarse, family_models
+
+def export_cascade(coarse, family_models, path=CASCADE_MODEL_PATH, min_confidence=0.9):
+    """Save the coarse tree and the family forests as one uncompressed .npz"""
+    arrays = {f'coarse__{name}': value for name, value in compile_forest(coarse).items()}
+    for i, forest in enumerate(family_models):
+        arrays.update({f'family_{i}__{name}': value for name, value in compile_forest(forest).items()})
+    write_atomically(path, lambda f: np.savez(f, format_version=COMPILED_FORMAT_VERSION,
+                                              min_confidence=min_confidence, **arrays))
+    print(f"Cascade saved as '{path}' ({len(family_models)} family forests, "
+          f"{sum(len(forest.estimators_) for forest in family_models)} trees)")
+
+def _single_row_latencies(model, X):
+    latencies = np.empty(len(X))
+    for i, row in enumerate(X):
+        started = time.perf_counter()
+        model.predict_proba(row[np.newaxis])
+        latencies[i] = time.perf_counter() - started
+    return latencies * 1e6
+
+def report_cascade(full_path, cascade_path, X, y):
+    """Compare the cascade with the monolithic forest on held-out data"""
+    CompiledForest = _compiled_forest_class()
+    from cascade import CascadeForest
+    full = CompiledForest.load(full_path)
+    cascade = CascadeForest.load(cascade_path, full)
+    
+    print(f"\nCascade report ({len(y)} held-out vehicles, single-row requests):")
+    print(f"{'':<10} {'accuracy':>9} {'mean us':>9} {'p99 us':>9}")
+    results = {}
+    for name, model in [('full', full), ('cascade', cascade)]:
+        latencies = _single_row_latencies(model, X)
+        results[name] = accuracy_score(y, model.predict(X)), latencies.mean(), np.percentile(latencies, 99)
+        print(f"{name:<10} {results[name][0]:>9.3f} {results[name][1]:>9.1f} {results[name][2]:>9.1f}")
+    accuracy_change = results['cascade'][0] - results['full'][0]
+    print(f"Accuracy {accuracy_change:+.3f}, mean latency {results['cascade'][1] / results['full'][1] - 1:+.1%}, "
+          f"p99 latency {results['cascade'][2] / results['full'][2] - 1:+.1%}")
+    stats = cascade.stats()
+    print(f"Coarse stage was unsure of {stats['fallback_rate']:.1%} of vehicles (sent to the full forest)")
+
+def split_thresholds(arrays):
+    """Sorted distinct thresholds each feature is split on, from compiled forest arrays"""
+    internal = arrays['left'] != np.arange(len(arrays['left']))
+    return [np.unique(arrays['threshold'][internal & (arrays['feature'] == j)]).astype(np.float64)
+            for j in range(int(arrays['n_features']))]
+
+def build_lookup_index(forest, arrays, X, max_cells=None, chunk_size=50000):
+    """Index the cells of the forest's threshold grid that the rows of X fall in.
+
+    Every feature is cut at the forest's own thresholds; a cell's key is its
+    bucket numbers in mixed radix. The forest is constant on a cell, so each
+    cell's probabilities are those of any one row in it. With max_cells only
+    the cells most rows fall in are kept. Probability rows are stored once and
+    shared by every cell that has them.
+    """
+    cuts = split_thresholds(arrays)
+    radix, size = [], 1
+    for feature_cuts in cuts:
+        radix.append(size)
+        size *= len(feature_cuts) + 1
+    if size > 2 ** 64:
+        raise ValueError(f"The forest's threshold grid has {size:.3g} cells, too many to key in 64 bits; "
+                         f"index a smaller forest (create_model.py compress)")
+    
+    keys = _backend_module('lookup_index').cell_keys(cuts, radix, X)
+    cells, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    if max_cells is not None and len(cells) > max_cells:
+        keep = np.sort(np.argsort(-counts, kind='stable')[:max_cells])
+        cells, first = cells[keep], first[keep]
+    
+    proba = np.vstack([forest.predict_proba(X[first[start:start + chunk_size]])
+                       for start in range(0, len(first), chunk_size)])
+    table, rows = np.unique(proba, axis=0, return_inverse=True)
+    return {
+        'cuts': np.concatenate(cuts),
+        'cut_offsets': np.cumsum([0] + [len(feature_cuts) for feature_cuts in cuts]),
+        'radix': np.array(radix, dtype=np.uint64),
+        'keys': cells,
+        'rows': rows.ravel().astype(np.uint16 if len(table) <= 2 ** 16 else np.uint32),
+        'proba': table,
+        'classes': arrays['classes'],
+    }
+
+def export_lookup_index(source_path, path=INDEX_MODEL_PATH, samples=500000, seed=1, max_cells=None):
+    """Build the lookup index of a compiled artifact from synthetic traffic and save it"""
+    CompiledForest = _compiled_forest_class()
+    forest = CompiledForest.load(source_path)
+    with np.load(source_path) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    X, _ = create_synthetic_data(samples, seed)
+    index = build_lookup_index(forest, arrays, X, max_cells)
+    with open(source_path, 'rb') as f:
+        source_sha256 = hashlib.sha256(f.read()).hexdigest()
+    # The backend only puts the index in front of the artifact it was built from
+    write_atomically(path, lambda f: np.savez(f, format_version=COMPILED_FORMAT_VERSION,
+                                              source_sha256=source_sha256, **index))
+    print(f"Lookup index saved as '{path}' ({len(index['keys'])} cells from {len(X)} rows, "
+          f"{len(index['proba'])} distinct probability rows)")
+
+def report_lookup_index(source_path, index_path, X):
+    """Size, hit rate and latency of the index on synthetic traffic it was not built from.
+
+    Returns whether the index reproduced the forest's probabilities exactly.
+    """
+    CompiledForest = _compiled_forest_class()
+    LookupIndex = _backend_module('lookup_index').LookupIndex
+    forest = CompiledForest.load(source_path)
+    index = LookupIndex.load(index_path, forest)
+    
+    exact = np.array_equal(index.predict_proba(X), forest.predict_proba(X))
+    stats = index.stats()
+    print(f"\nLookup index report ({len(X)} synthetic vehicles not used to build it):")
+    print(f"Index: {stats['cells']} cells, {os.path.getsize(index_path) / 1024:.0f} KB "
+          f"(forest {os.path.getsize(source_path) / 1024:.0f} KB)")
+    print(f"Hit rate: {stats['hit_rate']:.1%}; the other rows are answered by the forest")
+    print(f"Probabilities identical to the forest's: {'yes' if exact else 'NO'}")
     
+    print(f"{'':<8} {'single us':>10} {'batch us/row':>13}")
+    for name, model in [('forest', forest), ('index', index)]:
+        single = np.median(_single_row_latencies(model, X[:1000]))
+        started = time.perf_counter()
+        model.predict_proba(X)
+        batch = (time.perf_counter() - started) / len(X) * 1e6
+        print(f"{name:<8} {single:>10.1f} {batch:>13.2f}")
+    return exact
+
+
+def cached_selection_data(cache_dir=SELECTION_CACHE_DIR, n_samples=2000, seed=42, n_folds=3):
+    """Path of the model selection dataset, generating it only on the first run.
+
+    The file holds the synthetic data, the held-out rows and the fold of every
+    training row. Its name depends on the generator settings and on
+    VEHICLE_TYPES, so editing the vehicle parameters starts a new cache entry.
+    """
+    generator = json.dumps({'types': VEHICLE_TYPES, 'columns': FEATURE_COLUMNS,
+                            'samples': n_samples, 'seed': seed, 'folds': n_folds}, sort_keys=True)
+    digest = hashlib.sha256(generator.encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, f'selection-{digest}.npz')
+    if os.path.exists(path):
+        print(f"Using cached data and folds from '{path}'")
+        return path
+    
+    X, y = create_synthetic_data(n_samples, seed)
+    train, test = train_test_split(np.arange(len(y)), test_size=0.2, random_state=seed, stratify=y)
+    fold = np.empty(len(train), dtype=np.int64)
+    splitter = StratifiedKFold(n_folds, shuffle=True, random_state=seed)
+    for index, (_, validation) in enumerate(splitter.split(train, y[train])):
+        fold[validation] = index
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written under a temporary name so an interrupted run leaves no partial cache
+    write_atomically(path, lambda f: np.savez(f, X=X, y=y, train=train, test=test, fold=fold))
+    print(f"Cached {len(y)} rows and {n_folds} folds in '{path}'")
+    return path
+
+@lru_cache(maxsize=None)
+def _selection_data(path):
+    """The cached selection arrays, read once per worker process"""
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+def _forest(params, n_jobs=1):
+    return RandomForestClassifier(**dict(FOREST_PARAMS, **params, n_jobs=n_jobs))
+
+def _cross_validate(path, params, fold, n_rows):
+    """Validation accuracy of one candidate on one fold, fitted on at most n_rows rows"""
+    data = _selection_data(path)
+    X, y, train = data['X'], data['y'], data['train']
+    fit_rows = train[data['fold'] != fold][:n_rows]
+    validation_rows = train[data['fold'] == fold]
+    model = _forest(params).fit(X[fit_rows], y[fit_rows])
+    return accuracy_score(y[validation_rows], model.predict(X[validation_rows]))
+
+def _fit_selected(path, params):
+    """A candidate fitted on all training rows"""
+    data = _selection_data(path)
+    train = data['train']
+    return _forest(params).fit(data['X'][train], data['y'][train])
+
+def search_forests(path, grid=SEARCH_GRID, method='halving', factor=3, n_jobs=None):
+    """Cross-validated accuracy of every combination in grid, fitted across processes.
+
+    With method='grid' every candidate is fitted on all training rows of every
+    fold. With method='halving' the first round fits each candidate on a
+    fraction of the rows, and only the best 1/factor go on to the next round,
+    which gets factor times as many rows, until the survivors use all of them.
+    Returns one result per candidate, the best first, with the number of rows
+    its last round was fitted on.
+    """
+    data = _selection_data(path)
+    n_folds = int(data['fold'].max()) + 1
+    full_rows = int(min(np.sum(data['fold'] != fold) for fold in range(n_folds)))
+    candidates = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    rounds = 1 if method == 'grid' else max(math.ceil(math.log(len(candidates), factor)), 1)
+    results = [{'params': params, 'cv_accuracy': None, 'rows': 0} for params in candidates]
+    
+    alive = list(range(len(candidates)))
+    with ProcessPoolExecutor(n_jobs) as pool:
+        for round_index in range(rounds):
+            n_rows = max(full_rows // factor ** (rounds - 1 - round_index), 2 * len(VEHICLE_TYPES))
+            futures = {i: [pool.submit(_cross_validate, path, candidates[i], fold, n_rows) for fold in range(n_folds)]
+                       for i in alive}
+            for i, fold_futures in futures.items():
+                results[i].update(cv_accuracy=float(np.mean([future.result() for future in fold_futures])),
+                                  rows=n_rows)
+            alive.sort(key=lambda i: -results[i]['cv_accuracy'])
+            print(f"Round {round_index + 1}/{rounds}: {len(futures)} candidates x {n_folds} folds on "
+                  f"{n_rows} rows, best accuracy {results[alive[0]]['cv_accuracy']:.3f}")
+            if round_index < rounds - 1:
+                alive = alive[:math.ceil(len(alive) / factor)]
+    
+    return sorted(results, key=lambda result: (-result['rows'], -result['cv_accuracy']))
+
+def profile_candidates(path, results, n_jobs=None, cache_dir=SELECTION_CACHE_DIR):
+    """Fit the fully evaluated candidates and measure them as the backend serves them.
+
+    Adds the fitted model, held-out accuracy, compiled forest size, pickle
+    size, median single-row latency and per-row batch latency to each result.
+    Measurements run one at a time in this process so the timings are not
+    disturbed by the pool.
+    """
+    CompiledForest = _compiled_forest_class()
+    data = _selection_data(path)
+    X_test, y_test = data['X'][data['test']], data['y'][data['test']]
+    full_rows = max(result['rows'] for result in results)
+    finalists = [result for result in results if result['rows'] == full_rows]
+    with ProcessPoolExecutor(n_jobs) as pool:
+        models = list(pool.map(_fit_selected, [path] * len(finalists), [r['params'] for r in finalists]))
+    
+    candidate_path = os.path.join(cache_dir, 'candidate.npz')
+    for result, model in zip(finalists, models):
+        write_atomically(candidate_path,
+                         lambda f: np.savez(f, format_version=COMPILED_FORMAT_VERSION, **compile_forest(model)))
+        measured = _measure_artifact(CompiledForest, candidate_path, X_test, y_test, runs=1)
+        result.update(model=model, test_accuracy=measured['accuracy'], size_kb=measured['size_kb'],
+                      pickle_kb=len(pickle.dumps(model)) / 1024, latency_us=measured['latency_us'],
+                      batch_us=measured['batch_us'])
+    os.remove(candidate_path)
+
+def choose_candidate(results, min_accuracy, objective='latency'):
+    """The cheapest profiled candidate whose CV accuracy meets min_accuracy.
+
+    objective is the result key to minimise: 'latency_us', 'batch_us' or
+    'size_kb'. Without any candidate above the floor the most accurate one is
+    returned.
+    """
+    profiled = [result for result in results if 'latency_us' in result]
+    eligible = [result for result in profiled if result['cv_accuracy'] >= min_accuracy]
+    if not eligible:
+        return max(profiled, key=lambda result: result['cv_accuracy'])
+    return min(eligible, key=lambda result: (result[objective], -result['cv_accuracy']))
+
+def report_selection(results, chosen, min_accuracy, objective):
+    """Print the profiled candidates and the one chosen"""
+    names = list(results[0]['params'])
+    print(f"\nModel selection (CV accuracy floor {min_accuracy:.3f}, minimising {objective}):")
+    print(' '.join(f'{name:>17}' for name in names)
+          + f" {'cv acc':>7} {'test acc':>8} {'single us':>9} {'batch us':>8} {'npz KB':>8} {'pkl KB':>8}")
+    for result in results:
+        if 'latency_us' not in result:
+            continue
+        marker = ' <' if result is chosen else ''
+        print(' '.join(f'{result["params"][name]!s:>17}' for name in names)
+              + f" {result['cv_accuracy']:>7.3f} {result['test_accuracy']:>8.3f} {result['latency_us']:>9.1f}"
+                f" {result['batch_us']:>8.2f} {result['size_kb']:>8.0f} {result['pickle_kb']:>8.0f}{marker}")
+    pruned = sum('latency_us' not in result for result in results)
+    if pruned:
+        print(f"({pruned} candidates were dropped in earlier halving rounds)")
+    if chosen['cv_accuracy'] < min_accuracy:
+        print("No candidate reaches the accuracy floor; the most accurate one is shown")
+    print(f"Selected parameters: {json.dumps(dict(FOREST_PARAMS, **chosen['params']))}")
+
+def test_model(model):
+    """Run a few sample vehicles through the model"""
     # Test prediction
     print("\nTesting model with sample data...")
     
-    # Test cases: [length, height, width, weight, power, speed, axles, seats, diesel, electric, hybrid, petrol]
     test_cases = [
-        ([2.0, 1.1, 0.8, 200, 150, 180, 2, 1, 0, 0, 0, 1], "Bike"),
-        ([4.5, 1.5, 1.9, 1500, 150, 180, 2, 5, 0, 0, 0, 1], "Car"),
-        ([5.2, 1.9, 2.1, 2200, 250, 200, 2, 7, 1, 0, 0, 0], "SUV"),
-        ([12.0, 3.2, 2.5, 15000, 350, 100, 3, 50, 1, 0, 0, 0], "Bus"),
-        ([8.5, 3.0, 2.4, 12000, 400, 120, 4, 2, 1, 0, 0, 0], "Truck")
+        ({'length': 2.0, 'height': 1.1, 'width': 0.8, 'weight': 200, 'engine_power': 150,
+          'top_speed': 180, 'axle_count': 2, 'seats': 1, 'fuel_type': 'petrol'}, "Bike"),
+        ({'length': 4.5, 'height': 1.5, 'width': 1.9, 'weight': 1500, 'engine_power': 150,
+          'top_speed': 180, 'axle_count': 2, 'seats': 5, 'fuel_type': 'petrol'}, "Car"),
+        ({'length': 5.2, 'height': 1.9, 'width': 2.1, 'weight': 2200, 'engine_power': 250,
+          'top_speed': 200, 'axle_count': 2, 'seats': 7, 'fuel_type': 'diesel'}, "SUV"),
+        ({'length': 12.0, 'height': 3.2, 'width': 2.5, 'weight': 15000, 'engine_power': 350,
+          'top_speed': 100, 'axle_count': 3, 'seats': 50, 'fuel_type': 'diesel'}, "Bus"),
+        ({'length': 8.5, 'height': 3.0, 'width': 2.4, 'weight': 12000, 'engine_power': 400,
+          'top_speed': 120, 'axle_count': 4, 'seats': 2, 'fuel_type': 'diesel'}, "Truck")
     ]
     
-    for features, expected in test_cases:
-        prediction = model.predict([features])[0]
-        confidence = max(model.predict_proba([features])[0])
-        print(f"Expected: {expected:5} | Predicted: {prediction:5} | Confidence: {confidence:.2f}")
\ No newline at end of file
+    # Encoded exactly as the backend encodes requests
+    features, _, _ = ENCODER.encode_records([vehicle for vehicle, _ in test_cases])
+    probabilities = model.predict_proba(features)
+    for (_, expected), row in zip(test_cases, probabilities):
+        prediction = model.classes_[row.argmax()]
+        print(f"Expected: {expected:5} | Predicted: {prediction:5} | Confidence: {row.max():.2f}")
+
+def _grid_values(text):
+    """Comma-separated grid values for argparse; 'none' means no limit"""
+    return [None if value.strip().lower() == 'none' else int(value) for value in text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description="Vehicle classification model tools")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    train_parser = subparsers.add_parser('train', help="Train, save and test the model (default)")
+    train_parser.add_argument('--data', help="Sharded dataset directory (from 'generate'); "
+                              "without it a small synthetic dataset is generated in memory")
+    train_parser.add_argument('--output', default=MODEL_PATH, help="Where to save the pickled model")
+    train_parser.add_argument('--warm-start', action='store_true',
+                              help="Grow the forest shard by shard instead of loading all shards")
+    train_parser.add_argument('--trees-per-shard', type=int, default=10, help="Trees added per shard with --warm-start")
+    train_parser.add_argument('--eval-shards', type=int, default=1, help="Trailing shards held out for evaluation")
+    train_parser.add_argument('--n-jobs', type=int, default=-1, help="Cores used for fitting (-1 for all)")
+    
+    generate_parser = subparsers.add_parser('generate', help="Write a sharded synthetic dataset to disk")
+    generate_parser.add_argument('--samples', type=int, default=1000000, help="Total number of rows")
+    generate_parser.add_argument('--shard-size', type=int, default=100000, help="Rows per shard")
+    generate_parser.add_argument('--seed', type=int, default=42, help="Random seed")
+    generate_parser.add_argument('--output', default='data', help="Output directory")
+    
+    export_parser = subparsers.add_parser('export', help="Compile an existing model into flat arrays")
+    export_parser.add_argument('--model', default=MODEL_PATH, help="Pickled model to compile")
+    export_parser.add_argument('--output', default=COMPILED_MODEL_PATH, help="Compiled forest output path")
+    
+    compress_parser = subparsers.add_parser('compress', help="Build the pruned, quantized compact forest")
+    compress_parser.add_argument('--model', default=MODEL_PATH, help="Pickled model to compress")
+    compress_parser.add_argument('--output', default=COMPACT_MODEL_PATH, help="Compact forest output path")
+    compress_parser.add_argument('--max-depth', type=int, default=10, help="Depth at which trees are cut")
+    compress_parser.add_argument('--tolerance', type=float, default=0.01,
+                                 help="Accuracy that tree pruning may give up on the selection split")
+    compress_parser.add_argument('--min-trees', type=int, default=10, help="Trees always kept")
+    
+    cascade_parser = subparsers.add_parser('cascade', help="Train the coarse-to-fine cascade model")
+    cascade_parser.add_argument('--output', default=CASCADE_MODEL_PATH, help="Cascade output path")
+    cascade_parser.add_argument('--coarse-depth', type=int, default=8, help="Depth of the family tree")
+    cascade_parser.add_argument('--family-trees', type=int, default=20, help="Trees per family forest")
+    cascade_parser.add_argument('--family-depth', type=int, default=8, help="Depth of the family forests")
+    cascade_parser.add_argument('--min-confidence', type=float, default=0.9,
+                                help="Coarse confidence below which the full forest answers")
+    
+    select_parser = subparsers.add_parser('select', help="Search forest hyperparameters on cached CV folds")
+    for name, values in SEARCH_GRID.items():
+        select_parser.add_argument('--' + name.replace('_', '-'), type=_grid_values,
+                                   default=values, help=f"Values to try (default {','.join(map(str, values))})")
+    select_parser.add_argument('--min-samples-split', type=_grid_values,
+                               help=f"Values to try (default {FOREST_PARAMS['min_samples_split']})")
+    select_parser.add_argument('--method', choices=['halving', 'grid'], default='halving',
+                               help="Successive halving or an exhaustive grid")
+    select_parser.add_argument('--factor', type=int, default=3, help="Halving: candidates kept per round is 1/factor")
+    select_parser.add_argument('--folds', type=int, default=3, help="Cross-validation folds")
+    select_parser.add_argument('--samples', type=int, default=2000, help="Rows of synthetic data")
+    select_parser.add_argument('--jobs', type=int, help="Worker processes (default: all cores)")
+    select_parser.add_argument('--min-accuracy', type=float, default=0.9, help="CV accuracy floor")
+    select_parser.add_argument('--objective', choices=['latency', 'batch', 'size'], default='latency',
+                               help="What to minimise among candidates above the floor")
+    select_parser.add_argument('--cache-dir', default=SELECTION_CACHE_DIR, help="Where data and folds are cached")
+    select_parser.add_argument('--results', help="Write every candidate's scores to this JSON file")
+    select_parser.add_argument('--output', help="Save the selected model to this pickle path "
+                               "(and its compiled forest next to it)")
+    
+    index_parser = subparsers.add_parser('index', help="Build the decision lookup index of a compiled forest")
+    index_parser.add_argument('--model', default=COMPACT_MODEL_PATH,
+                              help="Compiled or compact forest to index (default: the compact forest)")
+    index_parser.add_argument('--output', default=INDEX_MODEL_PATH, help="Index output path")
+    index_parser.add_argument('--samples', type=int, default=500000, help="Synthetic rows whose cells are indexed")
+    index_parser.add_argument('--max-cells', type=int, help="Keep only this many of the most used cells")
+    index_parser.add_argument('--seed', type=int, default=1, help="Seed of the synthetic traffic")
+    
+    args = parser.parse_args()
+    
+    if args.command == 'generate':
+        write_synthetic_shards(args.output, args.samples, args.shard_size, args.seed)
+    elif args.command == 'export':
+        export_compiled_forest(joblib.load(args.model), args.output)
+    elif args.command == 'compress':
+        model = joblib.load(args.model)
+        # Half of train_model's test split picks the trees, the other half
+        # measures the result
+        _, X_test, _, y_test = training_split()
+        X_select, X_eval, y_select, y_eval = train_test_split(
+            X_test, y_test, test_size=0.5, random_state=42, stratify=y_test
+        )
+        export_compact_model(model, X_select, y_select, args.output, max_depth=args.max_depth,
+                             tolerance=args.tolerance, min_trees=args.min_trees)
+        if not os.path.exists(COMPILED_MODEL_PATH):
+            export_compiled_forest(model)
+        report_compression(COMPILED_MODEL_PATH, args.output, X_eval, y_eval)
+    elif args.command == 'cascade':
+        X_train, X_test, y_train, y_test = training_split()
+        coarse, family_models = train_cascade(X_train, y_train, args.coarse_depth,
+                                              args.family_trees, args.family_depth)
+        export_cascade(coarse, family_models, args.output, args.min_confidence)
+        if not os.path.exists(COMPILED_MODEL_PATH):
+            export_compiled_forest(joblib.load(MODEL_PATH))
+        report_cascade(COMPILED_MODEL_PATH, args.output, X_test, y_test)
+    elif args.command == 'index':
+        if not os.path.exists(args.model):
+            parser.error(f"{args.model} not found; build it with 'create_model.py compress' or 'export'")
+        try:
+            export_lookup_index(args.model, args.output, args.samples, args.seed, args.max_cells)
+        except ValueError as e:
+            parser.error(str(e))
+        # Fresh traffic, so the hit rate is not flattered by the rows the index came from
+        X_eval, _ = create_synthetic_data(20000, args.seed + 1000)
+        if not report_lookup_index(args.model, args.output, X_eval):
+            os.remove(args.output)
+            parser.error(f"Lookup index does not reproduce the forest's probabilities; removed '{args.output}'")
+    elif args.command == 'select':
+        grid = {name: getattr(args, name) for name in SEARCH_GRID}
+        if args.min_samples_split:
+            grid['min_samples_split'] = args.min_samples_split
+        objective = {'latency': 'latency_us', 'batch': 'batch_us', 'size': 'size_kb'}[args.objective]
+        path = cached_selection_data(args.cache_dir, args.samples, n_folds=args.folds)
+        results = search_forests(path, grid, args.method, args.factor, args.jobs)
+        profile_candidates(path, results, args.jobs, args.cache_dir)
+        chosen = choose_candidate(results, args.min_accuracy, objective)
+        report_selection(results, chosen, args.min_accuracy, objective)
+        if args.results:
+            with open(args.results, 'w') as f:
+                json.dump([{key: value for key, value in result.items() if key != 'model'} for result in results],
+                          f, indent=2)
+            print(f"Results written to '{args.results}'")
+        if args.output:
+            model = chosen['model']
+            model.n_jobs = None
+            write_atomically(args.output, lambda f: joblib.dump(model, f))
+            export_compiled_forest(model, os.path.join(os.path.dirname(args.output), COMPILED_MODEL_PATH))
+            data = _selection_data(path)
+            export_training_stats(data['X'][data['train']], data['y'][data['train']],
+                                  os.path.join(os.path.dirname(args.output), TRAINING_STATS_PATH))
+            print(f"Model saved as '{args.output}'")
+    elif args.command == 'train' and args.data:
+        train_from_shards(args.data, args.output, args.warm_start, args.trees_per_shard,
+                          args.n_jobs, args.eval_shards)
+    else:
+        model = train_model()
+        test_model(model)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+Feature encoding shared by training (create_model.py) and serving (backend/app.py)
+
+FEATURE_COLUMNS is the single definition of the model's input layout: the
+numeric measurements followed by the one-hot encoded fuel type. Both sides
+build their matrices through this module, so a model can never be trained on
+one column order and served with another.
+"""
+
+import math
+import threading
+
+import numpy as np
+
+NUMERIC_FIELDS = [
+    'length', 'height', 'width', 'weight',
+    'engine_power', 'top_speed', 'axle_count', 'seats'
+]
+INTEGER_FIELDS = ['axle_count', 'seats']
+FUEL_TYPES = ['diesel', 'electric', 'hybrid', 'petrol']
+
+FEATURE_COLUMNS = NUMERIC_FIELDS + [f'fuel_type_{fuel}' for fuel in FUEL_TYPES]
+REQUIRED_FIELDS = NUMERIC_FIELDS + ['fuel_type']
+
+
+class UnknownCategoryError(ValueError):
+    """A categorical field has a value the model was not trained on"""
+
+
+class FeatureEncoder:
+    """Turns vehicle dicts into model input rows in FEATURE_COLUMNS order.
+
+    Category lookups go through a precomputed table instead of per-call string
+    handling, and unknown categories are rejected rather than encoded as all
+    zeros. Batches are written into a per-thread buffer that is reused between
+    calls.
+    """
+
+    def __init__(self, fuel_types=FUEL_TYPES):
+        self.numeric_fields = list(NUMERIC_FIELDS)
+        self.fuel_types = list(fuel_types)
+        self.feature_columns = self.numeric_fields + [f'fuel_type_{fuel}' for fuel in self.fuel_types]
+        self.required_fields = self.numeric_fields + ['fuel_type']
+        self.n_features = len(self.feature_columns)
+        self.fuel_offset = len(self.numeric_fields)
+        self.integer_columns = [self.numeric_fields.index(field) for field in INTEGER_FIELDS]
+
+        # Row i is the encoding of fuel type i; indexing it replaces the
+        # if/elif chain
+        self.fuel_one_hot = np.eye(len(self.fuel_types))
+        self._fuel_rows = self.fuel_one_hot.tolist()
+        # Common spellings resolve with a single dict lookup; anything else is
+        # normalized once and retried
+        self._fuel_index = {}
+        for index, fuel in enumerate(self.fuel_types):
+            for spelling in (fuel, fuel.upper(), fuel.capitalize()):
+                self._fuel_index[spelling] = index
+        self._local = threading.local()
+
+    def fuel_index(self, value):
+        """Column offset of a fuel type within the one-hot block"""
+        # Lists and objects are not even hashable, so only strings are looked up
+        index = None
+        if isinstance(value, str):
+            index = self._fuel_index.get(value)
+            if index is None:
+                index = self._fuel_index.get(value.strip().lower())
+        if index is None:
+            raise UnknownCategoryError(f'Unknown fuel_type: {value!r} (expected one of {", ".join(self.fuel_types)})')
+        return index
+
+    def encode_one(self, data):
+        """Encode a single vehicle dict as a (1, n_features) matrix"""
+        # Plain Python floats until the end: element-wise writes into a numpy
+        # array cost more than building the row as a list
+        try:
+            values = [float(data[field]) for field in self.numeric_fields]
+        except TypeError:
+            # null, lists and objects; unparseable strings raise ValueError already
+            raise ValueError('Numeric fields must be numbers') from None
+        if not all(map(math.isfinite, values)):
+            raise ValueError('Numeric fields must be finite')
+        for j in self.integer_columns:
+            values[j] = float(math.trunc(values[j]))
+        values += self._fuel_rows[self.fuel_index(data['fuel_type'])]
+        return np.array([values])
+
+    def _buffer(self, n_rows):
+        """This thread's batch buffer, grown when a larger batch comes in"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or len(buffer) < n_rows:
+            buffer = self._local.buffer = np.empty((max(n_rows, 64), self.n_features))
+        return buffer[:n_rows]
+
+    def encode_batch(self, columns, n_rows, errors):
+        """Encode columns of raw values (keyed by required field) into a matrix.
+
+        Rows that cannot be encoded are recorded in ``errors`` (row -> message)
+        and left with placeholder values. The returned matrix is a view of this
+        thread's buffer and is only valid until the next call on the thread.
+        """
+        features = self._buffer(n_rows)
+        for j, field in enumerate(self.numeric_fields):
+            features[:, j] = _numeric_column(columns[field], field, errors)
+        features[:, self.integer_columns] = np.trunc(features[:, self.integer_columns])
+
+        fuel_index = np.empty(n_rows, dtype=np.intp)
+        lookup = self._fuel_index.get
+        for i, value in enumerate(columns['fuel_type']):
+            index = lookup(value) if isinstance(value, str) else None
+            if index is None:
+                try:
+                    index = self.fuel_index(value)
+                except UnknownCategoryError as e:
+                    errors.setdefault(i, str(e))
+                    index = 0
+            fuel_index[i] = index
+        features[:, self.fuel_offset:] = self.fuel_one_hot[fuel_index]
+        return features
+
+    def encode_records(self, records):
+        """Encode a list of vehicle dicts or a dict of equal-length columns.
+
+        Returns the feature matrix for the valid rows, the original indices of
+        those rows and a dict of per-row error messages.
+        """
+        errors = {}
+
+        if isinstance(records, dict):
+            # Columnar input: {"length": [...], "height": [...], ...}
+            for field in self.required_fields:
+                if not isinstance(records.get(field), list):
+                    raise ValueError(f'Missing column: {field}')
+            n_rows = len(records[self.required_fields[0]])
+            for field in self.required_fields:
+                if len(records[field]) != n_rows:
+                    raise ValueError(f'Column {field} has {len(records[field])} values, expected {n_rows}')
+            columns = {field: list(records[field]) for field in self.required_fields}
+        elif isinstance(records, list):
+            n_rows = len(records)
+            columns = {field: [None] * n_rows for field in self.required_fields}
+            for i, record in enumerate(records):
+                if not isinstance(record, dict):
+                    errors[i] = 'Vehicle must be a JSON object'
+                    continue
+                for field in self.required_fields:
+                    columns[field][i] = record.get(field)
+        else:
+            raise ValueError('Expected a list of vehicles or an object of columns')
+
+        # Missing values are reported per row and replaced by a placeholder so
+        # the remaining columns can still be converted in one go
+        for field in self.required_fields:
+            values = columns[field]
+            for i, value in enumerate(values):
+                if value is None:
+                    errors.setdefault(i, f'Missing field: {field}')
+                    values[i] = self.fuel_types[0] if field == 'fuel_type' else 0
+
+        features = self.encode_batch(columns, n_rows, errors)
+        if not errors:
+            return features, np.arange(n_rows), errors
+        valid = np.ones(n_rows, dtype=bool)
+        valid[list(errors)] = False
+        row_index = np.flatnonzero(valid)
+        return features[row_index], row_index, errors
+
+
+def _numeric_column(values, field, errors):
+    """Convert a column of raw values to floats, recording bad rows in errors"""
+    try:
+        column = np.asarray(values, dtype=float)
+        if column.ndim == 1 and np.isfinite(column).all():
+            return column
+    except (TypeError, ValueError):
+        pass
+
+    # Slow path: find the offending rows one by one
+    column = np.zeros(len(values))
+    for i, value in enumerate(values):
+        if i in errors:
+            continue
+        try:
+            column[i] = float(value)
+        except (TypeError, ValueError):
+            errors[i] = f'Invalid value for {field}: {value!r}'
+            continue
+        if not np.isfinite(column[i]):
+            column[i] = 0.0
+            errors[i] = f'Invalid value for {field}: {value!r}'
+    return column
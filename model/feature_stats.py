@@ -0,0 +1,110 @@
+"""
+Training distribution of the model's inputs, for drift detection
+
+create_model.py saves, next to the model, a histogram of every
+FEATURE_COLUMNS entry over the training data together with the fuel type and
+vehicle type frequencies. The backend's drift monitor (backend/drift.py)
+sorts production inputs into the same bins, so the two distributions can be
+compared bin for bin.
+
+Continuous features are cut at their training quantiles. Features with only a
+few distinct values (axle count, seats, the one-hot fuel flags) get one bin
+per value, cut halfway between neighbouring values. Every histogram also has
+a bin below the training minimum and one above the training maximum, which
+are empty for the training data itself.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from feature_encoder import FEATURE_COLUMNS, FUEL_TYPES
+
+STATS_FORMAT_VERSION = 1
+# Quantile bins per continuous feature
+N_QUANTILES = 20
+
+# Population stability index above which a distribution counts as shifted
+PSI_WARN = 0.1
+PSI_DRIFT = 0.25
+# Floor for empty bins, so the index stays finite
+_EPSILON = 1e-4
+
+
+def _cut_points(values, n_quantiles):
+    """Interior bin boundaries of one training column"""
+    distinct = np.unique(values)
+    if len(distinct) <= n_quantiles:
+        return (distinct[:-1] + distinct[1:]) / 2
+    return np.unique(np.quantile(values, np.linspace(0, 1, n_quantiles + 1))[1:-1])
+
+
+def bin_indices(feature, values):
+    """Histogram bin of each value for one feature of the saved statistics"""
+    values = np.asarray(values, dtype=np.float64)
+    cuts = feature['cuts']
+    index = np.searchsorted(cuts, values, side='right') + 1
+    index[values < feature['min']] = 0
+    index[values > feature['max']] = len(cuts) + 2
+    return index
+
+
+def training_statistics(X, y, feature_columns=FEATURE_COLUMNS, fuel_types=FUEL_TYPES, n_quantiles=N_QUANTILES):
+    """Per-feature histograms and fuel/class frequencies of a training set"""
+    X = np.asarray(X, dtype=np.float64)
+    features = {}
+    for j, name in enumerate(feature_columns):
+        column = X[:, j]
+        feature = {
+            'min': float(column.min()),
+            'max': float(column.max()),
+            'mean': float(column.mean()),
+            'cuts': np.asarray(_cut_points(column, n_quantiles), dtype=np.float64),
+        }
+        counts = np.bincount(bin_indices(feature, column), minlength=len(feature['cuts']) + 3)
+        feature['fractions'] = (counts / len(column)).tolist()
+        feature['cuts'] = feature['cuts'].tolist()
+        features[name] = feature
+
+    fuel_columns = [feature_columns.index(f'fuel_type_{fuel}') for fuel in fuel_types]
+    fuel_counts = X[:, fuel_columns].sum(axis=0)
+    classes, class_counts = np.unique(np.asarray(y).astype(str), return_counts=True)
+    return {
+        'format_version': STATS_FORMAT_VERSION,
+        'rows': len(X),
+        'feature_columns': list(feature_columns),
+        'features': features,
+        'fuel_types': {fuel: float(count / len(X)) for fuel, count in zip(fuel_types, fuel_counts)},
+        'classes': {str(label): float(count / len(X)) for label, count in zip(classes, class_counts)},
+    }
+
+
+def save_statistics(statistics, path):
+    # Moved into place once complete, so a running backend never reads half a file
+    with open(path + '.tmp', 'w') as f:
+        json.dump(statistics, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def load_statistics(path):
+    """Read statistics saved by create_model.py, ready for bin_indices"""
+    with open(path) as f:
+        statistics = json.load(f)
+    version = statistics.get('format_version')
+    if version != STATS_FORMAT_VERSION:
+        raise ValueError(f'{path} has format version {version}, expected {STATS_FORMAT_VERSION}; retrain the model')
+    for feature in statistics['features'].values():
+        feature['cuts'] = np.asarray(feature['cuts'], dtype=np.float64)
+    return statistics
+
+
+def population_stability(expected, observed):
+    """Population stability index between two distributions over the same bins"""
+    expected = np.maximum(np.asarray(expected, dtype=np.float64), _EPSILON)
+    observed = np.maximum(np.asarray(observed, dtype=np.float64), _EPSILON)
+    return float(np.sum((observed - expected) * np.log(observed / expected)))
+
+
+def drift_status(psi):
+    return 'drift' if psi >= PSI_DRIFT else 'warn' if psi >= PSI_WARN else 'ok'
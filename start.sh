@@ -9,4 +9,11 @@ export PORT=${PORT:-5000}
 
 # Start the Flask app with Gunicorn
 cd backend
-gunicorn --bind 0.0.0.0:$PORT --timeout 120 --workers 1 app:app
\ No newline at end of file
+# Workers, timeout and preloading are configured in gunicorn.conf.py
+# (set WEB_CONCURRENCY to change the number of workers).
+# SERVER_MODE=asgi serves the micro-batching ASGI app instead of plain Flask.
+if [ "$SERVER_MODE" = "asgi" ]; then
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:application
+else
+    gunicorn -c gunicorn.conf.py app:app
+fi
\ No newline at end of file